@@ -0,0 +1,196 @@
+import re
+import time
+from config import Config
+from utils.settings import parse_phrases
+
+AWAY = "away"
+RETURN = "return"
+COMMAND = "command"
+IGNORE = "ignore"
+
+
+def compile_phrases(phrases):
+    """One case-insensitive alternation matching any phrase as whole words.
+
+    Any run of whitespace matches the spaces inside a phrase. Phrases that
+    contain another phrase as whole words ("i'm back" and "back") can never
+    decide a match on their own, so they are left out of the alternation.
+    Returns None for an empty phrase list.
+    """
+    # Normalized phrase -> its alternative, with spaces matching any whitespace
+    alternatives = {
+        " ".join(phrase.lower().split()): r"\s+".join(map(re.escape, phrase.split()))
+        for phrase in phrases
+        if phrase.strip()
+    }
+    matchers = {phrase: _whole_words(alt) for phrase, alt in alternatives.items()}
+    needed = sorted(
+        alternative
+        for phrase, alternative in alternatives.items()
+        if not any(
+            other != phrase and matcher.search(phrase)
+            for other, matcher in matchers.items()
+        )
+    )
+    if not needed:
+        return None
+    return _whole_words("|".join(needed))
+
+
+def duration_minutes(match):
+    """Whole minutes of an away match, e.g. 90 for "1h30m" or "1.5 hours" """
+    minutes = float(match.group("number"))
+    if match.group("hours"):
+        extra = match.group("minutes") or match.group("bare_minutes") or 0
+        minutes = minutes * 60 + int(extra)
+    return round(minutes)
+
+
+def _whole_words(alternation):
+    # Lookarounds rather than \b, so phrases may start or end with punctuation
+    return re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+
+
+class MessageClassifier:
+    """Decides what a chat message is before any settings or storage I/O.
+
+    Almost every message the bot sees is ordinary chat, so on_message asks
+    ``classify()`` first and returns straight away on IGNORE. The patterns
+    are compiled once and matched case-insensitively, so the message is
+    never copied to lowercase either.
+
+    Return phrases and tracked channels can be set per guild. They are kept
+    here for ``ttl_seconds``; ``needs_settings()`` tells the caller when a
+    guild's entry is due to be reloaded from its settings. Until a guild has
+    an entry its messages use the default phrases in every channel.
+    """
+
+    # DM commands, matched at the start of the message
+    COMMAND_PATTERN = re.compile(r"[!/](awayreport|awaystatus)", re.IGNORECASE)
+    DATE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})")
+    # A duration: "20 min", "15m", "2h", "1.5 hours", "1h30m", "1 hr and 5 mins".
+    # It starts with a bare \d so the regex engine can skip ahead to digits;
+    # the word boundary is checked once one is found.
+    DURATION_PATTERN = re.compile(
+        r"""
+        (?P<number>\d(?<!\w\d)\d*(?:\.\d+)?)\s*
+        (?:
+            (?P<hours>hours?|hrs?|h)
+            (?:
+                \s*(?:and\s+)?(?P<minutes>\d+)\s*(?:minutes?|mins?|m)
+              | (?P<bare_minutes>\d{1,2})  # "1h30", only right after the unit
+            )?
+          | minutes?|mins?|m
+        )
+        (?P<away>\s*away)?
+        (?!\w)
+        """,
+        re.IGNORECASE | re.VERBOSE,
+    )
+    # A duration without "away" after it still counts right after one of these:
+    # "away for", "brb in", "afk", "back in", "be right back"
+    AWAY_CUE_PATTERN = re.compile(
+        r"""
+        (?<!\w)
+        (?:(?:away|afk|brb|be\s+right\s+back)(?:\s+(?:for|in))? | back\s+in)
+        \s+$
+        """,
+        re.IGNORECASE | re.VERBOSE,
+    )
+    AWAY_CUE_WINDOW = 32  # Characters before a duration searched for a cue
+    DEFAULT_RETURN_PATTERN = compile_phrases(parse_phrases(Config.RETURN_PHRASES))
+    # Settings that failed to load are tried again after this many seconds
+    SETTINGS_RETRY_SECONDS = 30
+
+    def __init__(self, ttl_seconds=None):
+        self.ttl = Config.SETTINGS_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        # guild_id -> (expires_at, phrases, compiled pattern or None, channel ids)
+        self._guilds = {}
+
+    def needs_settings(self, guild_id):
+        entry = self._guilds.get(guild_id)
+        return entry is None or entry[0] < time.monotonic()
+
+    def load_settings(self, guild_id, settings):
+        """Use the guild's return phrases and tracked channels from ``settings``.
+
+        ``settings`` is None when they could not be read. The guild then
+        keeps what it had, or the defaults, until a retry shortly after.
+        """
+        entry = self._guilds.get(guild_id)
+        if settings is None:
+            if entry is None:
+                entry = (0, None, self.DEFAULT_RETURN_PATTERN, frozenset())
+            self._guilds[guild_id] = (
+                time.monotonic() + self.SETTINGS_RETRY_SECONDS,
+                *entry[1:],
+            )
+            return
+
+        phrases = settings.return_phrase_list
+        if entry is not None and entry[1] == phrases:
+            pattern = entry[2]  # Unchanged, skip recompiling
+        else:
+            pattern = compile_phrases(phrases)
+        self._guilds[guild_id] = (
+            time.monotonic() + self.ttl,
+            phrases,
+            pattern,
+            settings.tracked_channel_ids,
+        )
+
+    def tracks_channel(self, guild_id, channel_id):
+        """Whether messages in the channel count, a set lookup per message"""
+        entry = self._guilds.get(guild_id)
+        if entry is None or not entry[3]:
+            return True  # No channels chosen, the whole guild is tracked
+        return channel_id in entry[3]
+
+    def return_pattern(self, guild_id=None):
+        entry = self._guilds.get(guild_id)
+        if entry is None:
+            return self.DEFAULT_RETURN_PATTERN
+        return entry[2]
+
+    def _announced_away(self, content, match):
+        """First duration from ``match`` on that announces an absence, or None.
+
+        "20 min away", "away for 1h" and "brb 15m" count; the "20 min" of
+        "took 20 min to build" does not.
+        """
+        while match:
+            start = match.start()
+            if match.group("away") or self.AWAY_CUE_PATTERN.search(
+                content, max(0, start - self.AWAY_CUE_WINDOW), start
+            ):
+                return match
+            match = self.DURATION_PATTERN.search(content, match.end())
+        return None
+
+    def classify(self, content, is_dm=False, guild_id=None):
+        """Return (kind, match) for a message.
+
+        kind is AWAY, RETURN, COMMAND or IGNORE. match is the away match
+        (see duration_minutes()), the command match (name in group 1) or the
+        return phrase match. DMs have no guild to track away time in, so
+        only commands count there.
+        """
+        if is_dm:
+            match = self.COMMAND_PATTERN.match(content)
+            if match:
+                return COMMAND, match
+            return IGNORE, None
+
+        # Most chat has no duration at all, so only the search runs for it
+        match = self.DURATION_PATTERN.search(content)
+        if match:
+            if not match.group("away"):
+                match = self._announced_away(content, match)
+            if match:
+                return AWAY, match
+
+        pattern = self.return_pattern(guild_id)
+        match = pattern.search(content) if pattern else None
+        if match:
+            return RETURN, match
+        return IGNORE, None
@@ -433,6 +433,24 @@ class EmbedHandler:
                 inline=True,
             )
 
+        if "return_phrase_list" in settings:
+            embed.add_field(
+                name="Return Phrases",
+                value=", ".join(settings["return_phrase_list"]) or "None",
+                inline=False,
+            )
+
+        if "tracked_channel_ids" in settings:
+            embed.add_field(
+                name="Tracked Channels",
+                value=", ".join(
+                    f"<#{channel_id}>"
+                    for channel_id in sorted(settings["tracked_channel_ids"])
+                )
+                or "All channels",
+                inline=False,
+            )
+
         return embed
 
     @staticmethod
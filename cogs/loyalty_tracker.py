@@ -1,75 +1,133 @@
-import re
+import os
+import asyncio
 import logging
+import itertools
 import traceback
 import discord
 from discord.ext import commands
 from datetime import datetime
+from cogs.classifier import AWAY, COMMAND, IGNORE, MessageClassifier, duration_minutes
 from cogs.embed import EmbedHandler
 from cogs.messages import MessageHandler
-from utils.db_manager import DatabaseManager
+from config import Config
+from utils.async_db import AsyncDatabaseManager
+from utils.message_queue import MessagePipeline
+from utils.storage import create_storage
 from utils.report import ReportGenerator
 
 
 class LoyaltyTracker(commands.Cog):
-    def __init__(self, bot, my_commands):
+    def __init__(self, bot, my_commands, db=None):
         self.bot = bot
-        self.db = DatabaseManager()
+        self.db = db or AsyncDatabaseManager(create_storage())
         self.logger = logging.getLogger("discord_bot")
-        self.report = ReportGenerator()
+        self.classifier = MessageClassifier()
+        self._filter_loads = {}  # guild_id -> task reloading its filters
+        # Handlers run on the pipeline's workers, off the gateway callback
+        self.pipeline = None
+        if Config.MESSAGE_WORKERS > 0:
+            self.pipeline = MessagePipeline(
+                self._process_message,
+                max_size=Config.MESSAGE_QUEUE_SIZE,
+                workers=Config.MESSAGE_WORKERS,
+                shed_policy=Config.MESSAGE_SHED_POLICY,
+            )
+
+    async def cog_load(self):
+        if self.pipeline:
+            self.pipeline.start()
+        # Load every guild's phrases and channels now, not on its first message
+        await asyncio.gather(
+            *(self.load_guild_filters(guild.id) for guild in self.bot.guilds)
+        )
+
+    async def cog_unload(self):
+        if self.pipeline:
+            await self.pipeline.close()
+            self.logger.info(f"Message pipeline stopped: {self.pipeline.stats()}")
+
+    async def load_guild_filters(self, guild_id):
+        """Load a guild's return phrases and tracked channels into the classifier.
+
+        Never raises: if the settings can't be read the classifier keeps its
+        previous entry (or the defaults) and retries after a short backoff.
+        """
+        try:
+            settings = await self.db.get_server_settings(guild_id)
+        except Exception as e:
+            self.logger.warning(f"Could not load settings for guild {guild_id}: {e}")
+            settings = None
+        self.classifier.load_settings(guild_id, settings)
+
+    def _refresh_guild_filters(self, guild_id):
+        """Reload an expired guild entry in the background, once at a time"""
+        if guild_id in self._filter_loads:
+            return
+        task = asyncio.create_task(self.load_guild_filters(guild_id))
+        self._filter_loads[guild_id] = task
+        task.add_done_callback(lambda _: self._filter_loads.pop(guild_id, None))
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        await self.load_guild_filters(guild.id)
 
     @commands.Cog.listener()
     async def on_message(self, message):
         """Listen for messages indicating a user is going away or returning"""
+        kind = IGNORE
         try:
             # Ignore messages from bots
             if message.author.bot:
                 return
 
-            # Process both DMs and messages in designated channels
+            # Process both DMs and messages in the guild's tracked channels
             is_dm = isinstance(message.channel, discord.DMChannel)
-            # if not is_dm and not self._should_track_channel(
-            #     message.channel.id, settings
-            # ):
-            #     return
-
-            content = message.content.lower()
-            # Check if this is a command in DMs
-            if is_dm:
-                if content.startswith("!awayreport") or content.startswith(
-                    "/awayreport"
-                ):
-                    date_match = re.search(r"(\d{4}-\d{2}-\d{2})", content)
-                    date = date_match.group(1) if date_match else None
-                    await self._handle_direct_awayreport(message, date)
+            guild_id = None if is_dm else message.guild.id
+            if guild_id:
+                if self.classifier.needs_settings(guild_id):
+                    # This message uses the current entry, no I/O on this path
+                    self._refresh_guild_filters(guild_id)
+                if not self.classifier.tracks_channel(guild_id, message.channel.id):
                     return
 
-                if content.startswith("!awaystatus") or content.startswith(
-                    "/awaystatus"
-                ):
-                    await self.away_status(message)
-                    return
+            # Classify first: ordinary chat never reaches settings or storage
+            kind, match = self.classifier.classify(message.content, is_dm, guild_id)
+            if kind == IGNORE:
+                return
+
+            if self.pipeline:
+                # Keyed by author, so each user's messages stay in order
+                self.pipeline.submit(message.author.id, kind, message, match)
+            else:
+                await self._process_message(kind, message, match)
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error in on_message: {e}")
+            if kind != IGNORE:  # Ordinary chat never gets a reply
+                await message.channel.send(
+                    "An error occurred while processing your message."
+                )
 
-            settings = self.db.get_server_settings(message.guild.id)
-            # Check if this is a "going away" message
-            away_match = re.search(r"(\d+)\s*(?:min|mins|minutes?)\s*away", content)
-            if away_match:
-                await self._handle_away_message(message, away_match, settings)
+    async def _process_message(self, kind, message, match):
+        """Handle a classified away, return or DM command message"""
+        try:
+            if kind == COMMAND:
+                if match.group(1).lower() == "awayreport":
+                    date_match = self.classifier.DATE_PATTERN.search(message.content)
+                    date = date_match.group(1) if date_match else None
+                    await self._handle_direct_awayreport(message, date)
+                else:
+                    await self.away_status(message)
                 return
 
-            # Check if this is a "return" message
-            return_indicators = [
-                "back",
-                "returned",
-                "i'm back",
-                "i am back",
-                "i have returned",
-            ]
-            if any(indicator in content for indicator in return_indicators):
+            settings = await self.db.get_server_settings(message.guild.id)
+            if kind == AWAY:
+                await self._handle_away_message(message, match, settings)
+            else:
                 await self._handle_return_message(message, settings)
-                return
         except Exception as e:
             traceback.print_exc()
-            self.logger.error(f"Error in on_message: {e}")
+            self.logger.error(f"Error processing message: {e}")
             await message.channel.send(
                 "An error occurred while processing your message."
             )
@@ -85,20 +143,15 @@ class LoyaltyTracker(commands.Cog):
 
             # Fetch data based on user role
             if is_admin:
-                daily_records, session_records = self.db._fetch_away_data(
-                    date, message.guild.id
+                admin_report = await self.db.run_report(
+                    self._render_admin_report, date, message.guild.id
                 )
-                if not daily_records:
+                if not admin_report:
                     await message.author.send(f"No away time records found for {date}")
                     return
-                report, is_pdf = self.report.generate_report(
-                    date=date,
-                    daily_records=daily_records,
-                    session_records=session_records,
-                    is_admin=True,
-                )
+                report, is_pdf = admin_report
             else:
-                user_record, session_records = self.db._fetch_away_data(
+                user_record, session_records = await self.db._fetch_away_data(
                     date, message.guild.id, user_id
                 )
                 if not user_record:
@@ -106,16 +159,12 @@ class LoyaltyTracker(commands.Cog):
                         f"You don't have any away time records for {date}"
                     )
                     return
-                report, is_pdf = self.report.generate_report(
+                report, is_pdf = ReportGenerator().generate_report(
                     date=date, user_record=user_record, session_records=session_records
                 )
 
             # Send report
-            if is_pdf:
-                with open(report, "rb") as f:
-                    await message.author.send(file=discord.File(f, report))
-            else:
-                await message.author.send(report)
+            await self._send_report(message.author, date, report, is_pdf)
 
         except Exception as e:
             self.logger.error(f"Error generating away report in DM: {e}")
@@ -123,6 +172,42 @@ class LoyaltyTracker(commands.Cog):
                 "An error occurred while retrieving the away time report."
             )
 
+    def _render_admin_report(self, date, guild_id):
+        """Render the admin report for a day, or None if it has no records.
+
+        Runs on the report executor, so a long render never holds up the
+        away/return writes. Rows from stream_away_data() go straight into
+        the renderer, so big days are never held in memory.
+        """
+        with self.db.sync.stream_away_data(date, guild_id) as stream:
+            daily_records, session_count, session_records = stream
+            daily_records = iter(daily_records)
+            first = next(daily_records, None)
+            if first is None:
+                return None
+
+            # A renderer per report, these run concurrently on the report executor
+            return ReportGenerator().generate_report(
+                date=date,
+                daily_records=itertools.chain([first], daily_records),
+                session_records=session_records,
+                is_admin=True,
+                session_count=session_count,
+            )
+
+    async def _send_report(self, destination, date, report, is_pdf):
+        """Send a rendered report; PDFs are deleted once sent"""
+        if not is_pdf:
+            await destination.send(report)
+            return
+        try:
+            with open(report, "rb") as f:
+                await destination.send(
+                    file=discord.File(f, filename=f"away_report_{date}.pdf")
+                )
+        finally:
+            os.remove(report)
+
     @commands.command(name="awayreport")
     async def away_report(self, ctx, date: str = None):
         """Get a report of away time on a specific date
@@ -138,37 +223,26 @@ class LoyaltyTracker(commands.Cog):
                 date = datetime.now().strftime("%Y-%m-%d")
 
             if is_admin:
-                daily_records, session_records = self.db._fetch_away_data(
-                    date, ctx.guild.id
+                admin_report = await self.db.run_report(
+                    self._render_admin_report, date, ctx.guild.id
                 )
-                if not daily_records:
+                if not admin_report:
                     await ctx.send(f"No away time records found for {date}")
                     return
-
-                # Format admin report
-                report, is_pdf = self.report.generate_report(
-                    date=date,
-                    daily_records=daily_records,
-                    session_records=session_records,
-                    is_admin=True,
-                )
+                report, is_pdf = admin_report
 
             else:
-                user_record, session_records = self.db._fetch_away_data(
+                user_record, session_records = await self.db._fetch_away_data(
                     date, ctx.guild.id, user_id
                 )
                 if not user_record:
                     await ctx.send(f"You don't have any away time records for {date}")
                     return
-                report, is_pdf = self.report.generate_report(
+                report, is_pdf = ReportGenerator().generate_report(
                     date, user_record=user_record, session_records=session_records
                 )
 
-            if is_pdf:
-                with open(report, "rb") as f:
-                    await ctx.send(file=discord.File(f, report))
-            else:
-                await ctx.send(report)
+            await self._send_report(ctx, date, report, is_pdf)
 
         except Exception as e:
             self.logger.error(f"Error generating away report: {e}")
@@ -180,26 +254,23 @@ class LoyaltyTracker(commands.Cog):
         try:
             guild_id = ctx.guild.id
             if not settings:
-                settings = self.db.get_server_settings(guild_id)
+                settings = await self.db.get_server_settings(guild_id)
 
             user_id = ctx.author.id
             today = datetime.now().strftime("%Y-%m-%d")
 
             # Check if user is currently away
-            active_session = self.db.get_active_away_session(user_id, guild_id)
+            active_session = await self.db.get_active_away_session(user_id, guild_id)
             if active_session:
-                now = datetime.now().time()
-                start_time = active_session["start_time"]
+                now_ts = datetime.now().timestamp()
                 expected_minutes = active_session["expected_minutes"]
 
-                time_diff = datetime.combine(datetime.today(), now) - datetime.combine(
-                    datetime.today(), start_time
-                )
-                elapsed_minutes = int(time_diff.total_seconds() / 60)
+                # Epoch arithmetic, so sessions crossing midnight stay positive
+                elapsed_minutes = int((now_ts - active_session["start_ts"]) / 60)
                 remaining_minutes = max(0, expected_minutes - elapsed_minutes)
 
                 # Get total away time today from database
-                total_today = self.db.get_today_away_time(user_id, guild_id)
+                total_today = await self.db.get_today_away_time(user_id, guild_id)
 
                 # Include current session in calculation
                 total_including_current = total_today + elapsed_minutes
@@ -218,7 +289,7 @@ class LoyaltyTracker(commands.Cog):
                 await ctx.send(embed=embed)
             else:
                 # User is not currently away
-                total_today = self.db.get_today_away_time(user_id, guild_id)
+                total_today = await self.db.get_today_away_time(user_id, guild_id)
                 remaining_today = max(
                     0, settings["max_daily_away_minutes"] - total_today
                 )
@@ -243,13 +314,13 @@ class LoyaltyTracker(commands.Cog):
             guild_id = ctx.guild.id
 
             # Check if user is already away
-            active_session = self.db.get_active_away_session(user_id, guild_id)
+            active_session = await self.db.get_active_away_session(user_id, guild_id)
             if active_session:
                 await ctx.send(f"❌ {user.mention} is already marked as away.")
                 return
 
             # Add the active away session to the database
-            self.db.add_active_away_session(
+            await self.db.add_active_away_session(
                 user_id, user.display_name, guild_id, minutes
             )
             embed = EmbedHandler.manual_away_message_embed(ctx, user, minutes)
@@ -268,14 +339,16 @@ class LoyaltyTracker(commands.Cog):
         """Manually clear a user's away status (admin only)"""
         try:
             user_id = user.id
+            guild_id = ctx.guild.id
 
             # Check if user is away
-            if user_id not in self.away_users:
+            active_session = await self.db.get_active_away_session(user_id, guild_id)
+            if not active_session:
                 await ctx.send(f"❌ {user.mention} is not currently marked as away.")
                 return
 
             # Clear away status
-            del self.away_users[user_id]
+            await self.db.remove_active_away_session(user_id, guild_id)
             embed = EmbedHandler.status_cleared_message_embed(user)
             await ctx.send(embed=embed)
             self.logger.info(
@@ -285,14 +358,6 @@ class LoyaltyTracker(commands.Cog):
             self.logger.error(f"Error in clear_away_status: {e}")
             await ctx.send("An error occurred while clearing the away status.")
 
-    def _should_track_channel(self, channel_id, settings):
-        """Determine if we should track messages in this channel"""
-        # List of specific channels to target
-        allowed_channel_ids = [settings["channel_id"]]
-
-        # Check if the channel_id is in the allowed list
-        return channel_id in allowed_channel_ids
-
     async def _is_admin(self, user_id):
         """Check if a user has admin permissions"""
         for guild in self.bot.guilds:
@@ -304,7 +369,7 @@ class LoyaltyTracker(commands.Cog):
     async def _handle_away_message(self, message, match, settings):
         """Handle when a user announces they're going away"""
         try:
-            if not self.db.is_work_hours(settings):
+            if not self.db.sync.is_work_hours(settings):
                 await message.channel.send(
                     "⏰ **Sorry, I can only track away time during work hours!**\n"
                     f"Work hours are from **{settings['work_start_hour']}** to **{settings['work_end_hour']}** on weekdays."
@@ -313,11 +378,11 @@ class LoyaltyTracker(commands.Cog):
 
             user_id = message.author.id
             user_name = message.author.display_name
-            minutes_away = int(match.group(1))
+            minutes_away = duration_minutes(match)
             guild_id = message.guild.id
 
             # Check if user is already away
-            active_session = self.db.get_active_away_session(user_id, guild_id)
+            active_session = await self.db.get_active_away_session(user_id, guild_id)
             if active_session:
                 await MessageHandler.already_away(message)
                 return
@@ -328,7 +393,7 @@ class LoyaltyTracker(commands.Cog):
                 minutes_away = settings["max_single_away_minutes"]
 
             # Check daily allowance
-            total_today = self.db.get_today_away_time(user_id, guild_id)
+            total_today = await self.db.get_today_away_time(user_id, guild_id)
             remaining_today = settings["max_daily_away_minutes"] - total_today
 
             if remaining_today <= 0:
@@ -339,7 +404,9 @@ class LoyaltyTracker(commands.Cog):
                 )
 
             # Record away status in the database
-            self.db.add_active_away_session(user_id, user_name, guild_id, minutes_away)
+            await self.db.add_active_away_session(
+                user_id, user_name, guild_id, minutes_away
+            )
 
             # Acknowledge
             channel = self.bot.get_channel(settings["channel_id"])
@@ -361,20 +428,17 @@ class LoyaltyTracker(commands.Cog):
             guild_id = message.guild.id
 
             # Check if user was away
-            active_session = self.db.get_active_away_session(user_id, guild_id)
+            active_session = await self.db.get_active_away_session(user_id, guild_id)
             if not active_session:
                 return  # User wasn't marked as away
 
-            # Calculate time away
-            now = datetime.now().time()
-            start_time = active_session["start_time"] # Time object
+            # Calculate time away from epoch seconds, safe across midnight
+            end_ts = int(datetime.now().timestamp())
+            start_ts = active_session["start_ts"]
 
             expected_minutes = active_session["expected_minutes"]
 
-            time_diff = datetime.combine(datetime.today(), now) - datetime.combine(
-                datetime.today(), start_time
-            )
-            actual_minutes = int(time_diff.total_seconds() / 60)
+            actual_minutes = int((end_ts - start_ts) / 60)
 
             # Calculate lateness beyond grace period
             late_minutes = max(
@@ -389,31 +453,20 @@ class LoyaltyTracker(commands.Cog):
                     late_minutes * settings["fee_percentage_per_minute"]
                 )
 
-            # Record session
-            self.db.record_away_session(
+            # Record session, update daily totals and clear away status together
+            daily_over_limit, daily_fee = await self.db.close_away_session(
                 user_id,
                 user_name,
                 message.guild.id,
-                datetime.combine(datetime.today(), start_time).strftime("%H:%M:%S"), # Time string
-                now.strftime("%H:%M:%S"),
+                start_ts,
+                end_ts,
                 expected_minutes,
                 actual_minutes,
                 accumulated_percentage,
-            )
-
-            # Update daily totals
-            daily_over_limit, daily_fee = self.db.update_daily_totals(
-                user_id,
-                user_name,
-                message.guild.id,
-                actual_minutes,
                 settings["max_daily_away_minutes"],
                 settings["fee_percentage_per_minute"],
             )
 
-            # Clear away status
-            self.db.remove_active_away_session(user_id, guild_id)
-
             # Send response based on outcome
             channel = self.bot.get_channel(settings["channel_id"])
             if late_minutes > 0 and daily_over_limit > 0:
@@ -0,0 +1,39 @@
+import logging
+import traceback
+from discord.ext import commands, tasks
+
+
+class Maintenance(commands.Cog):
+    """Periodic database housekeeping"""
+
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self.logger = logging.getLogger("discord_bot")
+
+    async def cog_load(self):
+        self.housekeeping.start()
+
+    async def cog_unload(self):
+        self.housekeeping.cancel()
+
+    @tasks.loop(hours=24)
+    async def housekeeping(self):
+        """Archive aged history, then roll up and prune expired sessions"""
+        try:
+            moved = await self.db.archive_old_data()
+            if moved:
+                self.logger.info(
+                    f"Archived {sum(moved.values())} rows across {len(moved)} months"
+                )
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error archiving old away data: {e}")
+
+        try:
+            pruned = await self.db.prune_old_sessions()
+            if pruned:
+                self.logger.info(f"Pruned {pruned} sessions into daily rollups")
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error pruning old away sessions: {e}")
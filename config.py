@@ -13,3 +13,54 @@ class Config:
     MAX_DAILY_AWAY_MINUTES = 90  # 1 hours 30 minutes
     WORK_START_TIME = time(9, 0)  # 9:00 AM
     WORK_END_TIME = time(17, 0)  # 5:00 PM
+    # Comma-separated phrases that mark a return, matched as whole words
+    RETURN_PHRASES = "back, returned, i'm back, i am back, i have returned"
+
+    # Storage backend: "sqlite", or "memory" for test runs and benchmarks
+    STORAGE_BACKEND = config("STORAGE_BACKEND", "sqlite")
+
+    # Database
+    DB_PATH = config("DB_PATH", "loyalty_bot.db")
+    DB_POOL_SIZE = int(config("DB_POOL_SIZE", 5))
+    DB_REPORT_POOL_SIZE = int(config("DB_REPORT_POOL_SIZE", 2))  # read-only
+    DB_JOURNAL_MODE = config("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS = config("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE = int(config("DB_CACHE_SIZE", -16000))  # negative = KiB
+    DB_MMAP_SIZE = int(config("DB_MMAP_SIZE", 268435456))  # 256 MiB
+
+    # Sharding: "none", "guild" (one file per guild) or "bucket" (DB_SHARD_BUCKETS
+    # files, guilds hashed across them). Shard files live in DB_SHARD_DIR.
+    DB_SHARD_MODE = config("DB_SHARD_MODE", "none").lower()
+    DB_SHARD_DIR = config("DB_SHARD_DIR", "shards")
+    DB_SHARD_BUCKETS = int(config("DB_SHARD_BUCKETS", 16))
+    DB_SHARD_MAX_OPEN = int(config("DB_SHARD_MAX_OPEN", 32))  # LRU of open shards
+    DB_SHARD_POOL_SIZE = int(config("DB_SHARD_POOL_SIZE", 2))  # connections per shard
+
+    # Write-behind: queue session writes and commit them in batches
+    DB_WRITE_BEHIND = config("DB_WRITE_BEHIND", False, cast=bool)
+    DB_WRITE_BEHIND_INTERVAL_MS = int(config("DB_WRITE_BEHIND_INTERVAL_MS", 50))
+    DB_WRITE_BEHIND_MAX_BATCH = int(config("DB_WRITE_BEHIND_MAX_BATCH", 200))
+
+    # In-process caches
+    SETTINGS_CACHE_TTL = int(config("SETTINGS_CACHE_TTL", 300))  # seconds
+    REPORT_CACHE_SIZE = int(config("REPORT_CACHE_SIZE", 256))  # past-day reports
+
+    # Away/return messages are queued for a pool of workers; when the queue is
+    # full "newest" drops incoming messages, "oldest" the longest-waiting one.
+    # 0 workers handles every message inline in on_message.
+    MESSAGE_QUEUE_SIZE = int(config("MESSAGE_QUEUE_SIZE", 1000))
+    MESSAGE_WORKERS = int(config("MESSAGE_WORKERS", 4))
+    MESSAGE_SHED_POLICY = config("MESSAGE_SHED_POLICY", "newest").lower()
+
+    # Reports for days with more sessions than this are streamed off the cursor
+    REPORT_STREAM_THRESHOLD = int(config("REPORT_STREAM_THRESHOLD", 1000))
+    REPORT_STREAM_CHUNK_SIZE = int(config("REPORT_STREAM_CHUNK_SIZE", 500))
+
+    # Archival of old history into per-month files, 0 days disables it
+    ARCHIVE_DIR = config("ARCHIVE_DIR", "archive")
+    ARCHIVE_AFTER_DAYS = int(config("ARCHIVE_AFTER_DAYS", 0))
+
+    # Retention: roll up and prune sessions older than this, 0 days disables it
+    RETENTION_DAYS = int(config("RETENTION_DAYS", 0))
+    RETENTION_BATCH_SIZE = int(config("RETENTION_BATCH_SIZE", 500))
+    RETENTION_VACUUM_PAGES = int(config("RETENTION_VACUUM_PAGES", 1000))
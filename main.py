@@ -4,9 +4,11 @@ import discord
 from discord.ext import commands
 from config import Config
 from utils.commands import MyCommands
-from utils.db_manager import DatabaseManager
+from utils.async_db import AsyncDatabaseManager
+from utils.storage import create_storage
 from utils.logger import setup_logger
 from cogs.loyalty_tracker import LoyaltyTracker
+from cogs.maintenance import Maintenance
 from utils.on_boarding import OnBoarding
 
 # Initialize logging
@@ -22,8 +24,12 @@ intents.message_content = True
 # Initialize bot
 bot = commands.Bot(command_prefix=Config.PREFIX, intents=intents)
 
+# Shared storage backend (STORAGE_BACKEND), so every cog uses the same
+# connection pool. The async wrapper keeps sqlite3 calls off the event loop.
+db = AsyncDatabaseManager(create_storage())
+
 # Initialize MyCommands
-my_commands = MyCommands(bot)
+my_commands = MyCommands(bot, db)
 
 
 # Load loyalty tracking cog
@@ -31,21 +37,26 @@ my_commands = MyCommands(bot)
 async def on_ready():
     logger.info(f"Bot is ready! Logged in as {bot.user.name}")
     # Initialize database
-    db = DatabaseManager()
-    db.initialize()
+    await db.initialize()
 
     try:
-        await bot.add_cog(LoyaltyTracker(bot, my_commands))
+        await bot.add_cog(LoyaltyTracker(bot, my_commands, db))
         logger.info("Loyalty tracker cog loaded successfully.")
     except Exception as e:
         logger.error(f"Failed to load LoyaltyTracker cog: {e}")
 
     try:
-        await bot.add_cog(OnBoarding(bot, my_commands))
+        await bot.add_cog(OnBoarding(bot, my_commands, db))
         logger.info("Server settings cog loaded successfully.")
     except Exception as e:
         logger.error(f"Failed to load ServerSettings cog: {e}")
 
+    try:
+        await bot.add_cog(Maintenance(bot, db))
+        logger.info("Maintenance cog loaded successfully.")
+    except Exception as e:
+        logger.error(f"Failed to load Maintenance cog: {e}")
+
     # Sync commands with Discord
     try:
         synced = await bot.tree.sync()
@@ -55,8 +66,11 @@ async def on_ready():
 
 
 async def main():
-    async with bot:
-        await bot.start(Config.TOKEN)
+    try:
+        async with bot:
+            await bot.start(Config.TOKEN)
+    finally:
+        db.close()
 
 
 # Run bot
@@ -0,0 +1,59 @@
+"""Times MessageClassifier.classify against the old single-regex check.
+
+Run from the repository root: ``python tests/bench_classifier.py [rounds]``
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import conftest  # noqa: E402,F401  (environment and import path)
+from test_classifier import AWAY_CORPUS, LOOKALIKE_CORPUS  # noqa: E402
+from cogs.classifier import MessageClassifier  # noqa: E402
+
+# What on_message matched before the classifier existed
+OLD_AWAY_PATTERN = re.compile(r"(\d+)\s*(?:min|mins|minutes?)\s*away")
+
+CHAT_WORDS = (
+    "the build is green again can someone review my pr before lunch "
+    "thanks for the feedback i pushed a fix to the background worker"
+).split()
+
+
+def chat_messages(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(3, 25)))
+        for _ in range(count)
+    ]
+
+
+def main(rounds=20):
+    classifier = MessageClassifier()
+    workloads = {
+        "chat": chat_messages(1000),
+        "away": [text for text, _ in AWAY_CORPUS],
+        "look-alikes": LOOKALIKE_CORPUS,
+    }
+    print(f"{'workload':<12} {'messages':>8} {'old (us)':>9} {'new (us)':>9}")
+    for name, messages in workloads.items():
+        old = timeit.timeit(
+            lambda: [OLD_AWAY_PATTERN.search(m.lower()) for m in messages],
+            number=rounds,
+        )
+        new = timeit.timeit(
+            lambda: [classifier.classify(m, guild_id=1) for m in messages],
+            number=rounds,
+        )
+        per_message = 1e6 / (rounds * len(messages))
+        print(
+            f"{name:<12} {len(messages):>8} "
+            f"{old * per_message:>9.2f} {new * per_message:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config.py reads these at import time; the tests never connect to Discord
+os.environ.setdefault("DISCORD_TOKEN", "test-token")
+os.environ.setdefault("ANNOUNCEMENT_CHANNEL_ID", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
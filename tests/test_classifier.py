@@ -0,0 +1,138 @@
+import pytest
+from cogs.classifier import (
+    AWAY,
+    COMMAND,
+    IGNORE,
+    RETURN,
+    MessageClassifier,
+    compile_phrases,
+    duration_minutes,
+)
+from utils.settings import ServerSettings
+
+# Away announcements and the minutes they should record
+AWAY_CORPUS = [
+    ("20 min away", 20),
+    ("30mins away", 30),
+    ("going 10 minutes away", 10),
+    ("5 MIN AWAY", 5),
+    ("1 minute away", 1),
+    ("going 15min away for coffee", 15),
+    ("I'll be 25 min away, lunch", 25),
+    ("away for 1h", 60),
+    ("Away For 3 Minutes", 3),
+    ("away 45 mins", 45),
+    ("away for 1.5 hours", 90),
+    ("away for 1 hr 5 mins", 65),
+    ("2h away", 120),
+    ("1h30m away", 90),
+    ("1h 30m away", 90),
+    ("1h30 away", 90),
+    ("1 hour and 30 minutes away", 90),
+    ("brb 15m", 15),
+    ("BRB 5 min", 5),
+    ("brb in 10 mins", 10),
+    ("brb 0.25h", 15),
+    ("afk 2 hrs", 120),
+    ("be right back 10 min", 10),
+    ("back in 5 min", 5),
+    ("be back in 20 minutes", 20),
+    ("build took 20 min, brb 5m", 5),
+]
+
+# Messages that look like announcements but aren't
+LOOKALIKE_CORPUS = [
+    "brb",
+    "away",
+    "away for a bit",
+    "awayfor 1h",
+    "took 20 min to compile",
+    "the 10m run",
+    "feedback in 10m",
+    "meeting at 3pm",
+    "2 months away from release",
+    "takeaway for 5 mins",
+    "brb 5 people waiting",
+    "v2h away",
+    "10mb away",
+    "came back 5 min ago",
+]
+
+RETURN_CORPUS = ["I'm back", "back!", "Returned.", "i   am   back", "BACK"]
+
+# Substrings of a return phrase that used to count as returns
+NOT_RETURN_CORPUS = [
+    "background job failed",
+    "thanks for the feedback",
+    "backend deploy",
+    "piggyback",
+    "returnedx",
+]
+
+
+@pytest.fixture
+def classifier():
+    return MessageClassifier()
+
+
+@pytest.mark.parametrize("text,minutes", AWAY_CORPUS)
+def test_away_announcements(classifier, text, minutes):
+    kind, match = classifier.classify(text, guild_id=1)
+    assert kind == AWAY
+    assert duration_minutes(match) == minutes
+
+
+@pytest.mark.parametrize("text", LOOKALIKE_CORPUS)
+def test_lookalikes_are_not_away(classifier, text):
+    kind, _ = classifier.classify(text, guild_id=1)
+    assert kind != AWAY
+
+
+@pytest.mark.parametrize("text", RETURN_CORPUS)
+def test_return_phrases(classifier, text):
+    assert classifier.classify(text, guild_id=1)[0] == RETURN
+
+
+@pytest.mark.parametrize("text", NOT_RETURN_CORPUS)
+def test_return_phrases_match_whole_words(classifier, text):
+    assert classifier.classify(text, guild_id=1)[0] == IGNORE
+
+
+def test_dm_only_classifies_commands(classifier):
+    kind, match = classifier.classify("!awayreport 2024-02-01", is_dm=True)
+    assert kind == COMMAND
+    assert match.group(1) == "awayreport"
+    assert classifier.classify("20 min away", is_dm=True)[0] == IGNORE
+
+
+def test_compile_phrases_drops_redundant_phrases():
+    pattern = compile_phrases(("back", "i'm back", "returned", "a  b", "a b"))
+    assert pattern.pattern == r"(?<!\w)(?:a\s+b|back|returned)(?!\w)"
+    assert compile_phrases(()) is None
+
+
+def test_guild_settings(classifier):
+    settings = ServerSettings.from_row(
+        5, {"return_phrases": "done, all set", "tracked_channels": "7,8"}
+    )
+    classifier.load_settings(5, settings)
+
+    assert classifier.classify("all   set", guild_id=5)[0] == RETURN
+    assert classifier.classify("I'm back", guild_id=5)[0] == IGNORE
+    assert classifier.tracks_channel(5, 7)
+    assert not classifier.tracks_channel(5, 9)
+    # Guilds without settings use the defaults in every channel
+    assert classifier.tracks_channel(6, 9)
+    assert classifier.classify("I'm back", guild_id=6)[0] == RETURN
+
+
+def test_failed_settings_keep_previous_entry(classifier):
+    settings = ServerSettings.from_row(5, {"tracked_channels": "7"})
+    classifier.load_settings(5, settings)
+    classifier.load_settings(5, None)
+    assert not classifier.tracks_channel(5, 9)
+    assert not classifier.needs_settings(5)
+
+    classifier.load_settings(6, None)
+    assert classifier.tracks_channel(6, 9)
+    assert classifier.return_pattern(6) is MessageClassifier.DEFAULT_RETURN_PATTERN
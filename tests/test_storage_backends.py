@@ -0,0 +1,236 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from config import Config
+from utils.aggregates import PERIOD_KEYS
+from utils.db_manager import DatabaseManager
+from utils.memory_storage import MemoryStorage
+from utils.settings import ServerSettings
+from utils.sharding import ShardedStorage
+from utils.storage import clock_time
+
+GUILD = 10
+ALICE, BOB = 1, 2
+MAX_DAILY = 90
+FEE_PERCENTAGE = 0.01
+BASE_TS = int(datetime.now().replace(hour=9, minute=0, second=0).timestamp())
+
+
+class EvictingShardedStorage(ShardedStorage):
+    """Checks out a scratch shard after every call. With max_open=1 each
+    call then finds its guild's shard evicted and has to reopen it."""
+
+    SCRATCH = "guild_scratch"
+
+    @contextmanager
+    def _checkout(self, name):
+        with super()._checkout(name) as db:
+            yield db
+        if name != self.SCRATCH:
+            with super()._checkout(self.SCRATCH):
+                pass
+
+
+@pytest.fixture(params=["sqlite", "memory", "sharded"])
+def storage(request, tmp_path, monkeypatch):
+    """Every StorageBackend test runs once per backend"""
+    if request.param == "sqlite":
+        backend = DatabaseManager(
+            str(tmp_path / "loyalty_bot.db"),
+            archive_dir=str(tmp_path / "archive"),
+            pool_size=2,
+        )
+    elif request.param == "sharded":
+        monkeypatch.setattr(Config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+        backend = EvictingShardedStorage(
+            "guild", shard_dir=str(tmp_path), max_open=1, pool_size=1
+        )
+    else:
+        backend = MemoryStorage()
+    backend.initialize()
+    yield backend
+    backend.close()
+
+
+def close_session(storage, user_id, user_name, offset_minutes, minutes, fee=0.0):
+    start_ts = BASE_TS + offset_minutes * 60
+    storage.add_active_away_session(user_id, user_name, GUILD, minutes)
+    return storage.close_away_session(
+        user_id,
+        user_name,
+        GUILD,
+        start_ts,
+        start_ts + minutes * 60,
+        minutes,
+        minutes,
+        fee,
+        MAX_DAILY,
+        FEE_PERCENTAGE,
+    )
+
+
+@pytest.fixture
+def history(storage):
+    """Three sessions today, closed out of start order"""
+    close_session(storage, ALICE, "alice", 120, 60, fee=0.5)
+    close_session(storage, BOB, "bob", 30, 20)
+    close_session(storage, ALICE, "alice", 0, 50)
+    return storage
+
+
+def session_row(offset_minutes, minutes, fee=0.0):
+    start_ts = BASE_TS + offset_minutes * 60
+    return (
+        clock_time(start_ts),
+        clock_time(start_ts + minutes * 60),
+        minutes,
+        minutes,
+        fee,
+    )
+
+
+def test_settings_default_to_config(storage):
+    assert storage.get_server_settings(GUILD) == ServerSettings.from_row(GUILD)
+    assert (
+        storage.get_server_setting(GUILD, "max_daily_away_minutes")
+        == Config.MAX_DAILY_AWAY_MINUTES
+    )
+
+
+def test_update_server_settings(storage):
+    assert storage.update_server_settings(
+        GUILD, {"max_daily_away_minutes": 60, "return_phrases": "done, all set"}
+    )
+    settings = storage.get_server_settings(GUILD)
+    assert settings.max_daily_away_minutes == 60
+    assert settings.return_phrase_list == ("done", "all set")
+    # A row created by an update takes the table defaults for the rest
+    assert settings.grace_period_minutes == 1
+    assert storage.get_server_setting(GUILD, "max_daily_away_minutes") == 60
+
+    assert storage.update_server_setting(GUILD, "max_daily_away_minutes", 30)
+    assert storage.get_server_settings(GUILD).max_daily_away_minutes == 30
+    assert storage.get_server_settings(GUILD).return_phrase_list == ("done", "all set")
+
+
+def test_update_unknown_setting_raises(storage):
+    with pytest.raises(ValueError):
+        storage.update_server_settings(GUILD, {"guild_id": 1})
+
+
+def test_save_guild_config_replaces_settings(storage):
+    storage.update_server_settings(GUILD, {"grace_period_minutes": 5})
+    storage.save_guild_config(GUILD, {"max_daily_away_minutes": 45})
+
+    settings = storage.get_server_settings(GUILD)
+    assert settings.max_daily_away_minutes == 45
+    assert settings.grace_period_minutes == Config.GRACE_PERIOD_MINUTES
+
+
+def test_close_away_session_totals(storage):
+    storage.add_active_away_session(ALICE, "alice", GUILD, 50)
+    assert storage.get_active_away_session(ALICE, GUILD)["expected_minutes"] == 50
+
+    assert close_session(storage, ALICE, "alice", 0, 50) == (0, 0)
+    assert storage.get_active_away_session(ALICE, GUILD) is None
+
+    over_limit, fee = close_session(storage, ALICE, "alice", 60, 60)
+    assert over_limit == 20
+    assert fee == pytest.approx(20 * FEE_PERCENTAGE)
+    assert storage.get_today_away_time(ALICE, GUILD) == 110
+    assert storage.get_today_away_time(BOB, GUILD) == 0
+
+
+def test_fetch_away_data_for_user(history):
+    today = datetime.now().strftime("%Y-%m-%d")
+    record, sessions = history._fetch_away_data(today, GUILD, ALICE)
+
+    assert tuple(record) == pytest.approx(("alice", 110, 20, 0.5))
+    assert [tuple(s) for s in sessions] == [
+        session_row(0, 50),
+        session_row(120, 60, fee=0.5),
+    ]
+    assert history._fetch_away_data(today, GUILD, 99) == (None, [])
+
+
+def test_fetch_away_data_for_admin(history):
+    today = datetime.now().strftime("%Y-%m-%d")
+    daily, sessions = history._fetch_away_data(today, GUILD)
+
+    # Ordered by total_minutes; the fee is the sum of the session fees
+    assert [tuple(d) for d in daily] == [("alice", 110, 20, 0.5), ("bob", 20, 0, 0.0)]
+    assert [tuple(s) for s in sessions] == [
+        ("alice", *session_row(0, 50)),
+        ("bob", *session_row(30, 20)),
+        ("alice", *session_row(120, 60, fee=0.5)),
+    ]
+    assert history._fetch_away_data(today, GUILD + 1) == ([], [])
+
+
+def test_stream_away_data_matches_fetch(history):
+    today = datetime.now().strftime("%Y-%m-%d")
+    with history.stream_away_data(today, GUILD) as (summary, count, sessions):
+        streamed = [tuple(d) for d in summary], count, [tuple(s) for s in sessions]
+
+    daily, sessions = history._fetch_away_data(today, GUILD)
+    assert streamed == ([tuple(d) for d in daily], 3, [tuple(s) for s in sessions])
+
+
+@pytest.mark.parametrize("period_type", ["week", "month"])
+def test_get_period_totals(history, period_type):
+    period = PERIOD_KEYS[period_type](datetime.now().strftime("%Y-%m-%d"))
+
+    rows = history.get_period_totals(GUILD, period_type, period)
+    # (user_id, user_name, sessions, minutes, over limit, late, fee)
+    assert [tuple(r) for r in rows] == [
+        (ALICE, "alice", 2, 110, 20, 1, 0.5),
+        (BOB, "bob", 1, 20, 0, 0, 0.0),
+    ]
+    rows = history.get_period_totals(GUILD, period_type, period, user_id=BOB)
+    assert [tuple(r) for r in rows] == [(BOB, "bob", 1, 20, 0, 0, 0.0)]
+    assert history.get_period_totals(GUILD, period_type, "1999-01") == []
+
+
+def test_sharded_guilds_stay_separate(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    # Queued writes make an evicted shard slow to close, so a reopen that
+    # doesn't wait for the close loses the active sessions still queued
+    monkeypatch.setattr(Config, "DB_WRITE_BEHIND", True)
+    monkeypatch.setattr(Config, "DB_WRITE_BEHIND_INTERVAL_MS", 1000)
+    storage = ShardedStorage("guild", shard_dir=str(tmp_path), max_open=2, pool_size=1)
+    storage.initialize()
+    guilds = range(1, 9)
+
+    def use_guild(guild_id):
+        # Every round opens this guild's shard again, evicting another's
+        for minutes in range(20):
+            storage.update_server_settings(
+                guild_id, {"max_daily_away_minutes": guild_id * 100 + minutes}
+            )
+            storage.add_active_away_session(guild_id, f"user{guild_id}", guild_id, 5)
+            settings = storage.get_server_settings(guild_id)
+            session = storage.get_active_away_session(guild_id, guild_id)
+            assert settings.max_daily_away_minutes == guild_id * 100 + minutes
+            assert session["user_name"] == f"user{guild_id}"
+            assert storage.get_active_away_session(guild_id + 1, guild_id) is None
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(guilds)) as executor:
+            list(executor.map(use_guild, guilds))
+        assert len(storage._open) <= 2
+    finally:
+        storage.close()
+
+    # Everything was written to each guild's own file
+    storage = ShardedStorage("guild", shard_dir=str(tmp_path), max_open=2, pool_size=1)
+    try:
+        for guild_id in guilds:
+            assert storage.get_server_settings(guild_id).max_daily_away_minutes == (
+                guild_id * 100 + 19
+            )
+            session = storage.get_active_away_session(guild_id, guild_id)
+            assert session["user_name"] == f"user{guild_id}"
+    finally:
+        storage.close()
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+from config import Config
+from utils.db_manager import DatabaseManager
+from utils.db_pool import ConnectionPool
+from utils.write_behind import WriteBehindQueue
+
+# Long enough that the flush thread never runs during a test
+FLUSH_INTERVAL_MS = 60_000
+INSERT_SQL = "INSERT INTO items (id, name) VALUES (?, ?)"
+
+
+def count_rows(path, table):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DB_WRITE_BEHIND", True)
+    monkeypatch.setattr(Config, "DB_WRITE_BEHIND_INTERVAL_MS", FLUSH_INTERVAL_MS)
+    manager = DatabaseManager(
+        str(tmp_path / "loyalty_bot.db"), archive_dir=str(tmp_path / "archive")
+    )
+    manager.initialize()
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / "items.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    # A short busy timeout, so a locked database fails the flush quickly
+    pool = ConnectionPool(path, size=1, timeout=0.1)
+    write_queue = WriteBehindQueue(pool, flush_interval_ms=FLUSH_INTERVAL_MS)
+    yield path, write_queue
+    write_queue.close()
+    pool.close()
+
+
+def test_writes_wait_for_flush(db):
+    db.add_active_away_session(1, "alice", 10, 20)
+
+    assert len(db.write_queue) == 1
+    assert count_rows(db.db_path, "active_away_sessions") == 0
+    # Reads are served from the index until then
+    assert db.get_active_away_session(1, 10)["expected_minutes"] == 20
+
+    assert db.write_queue.flush() == 1
+    assert len(db.write_queue) == 0
+    assert count_rows(db.db_path, "active_away_sessions") == 1
+
+
+def test_close_writes_queued_groups(db):
+    db.add_active_away_session(1, "alice", 10, 20)
+    db.add_active_away_session(2, "bob", 10, 30)
+
+    db.close()
+    assert count_rows(db.db_path, "active_away_sessions") == 2
+
+
+def test_locked_database_keeps_batch_queued(queue):
+    path, write_queue = queue
+    write_queue.enqueue([(INSERT_SQL, (1, "a"))])
+    write_queue.enqueue([(INSERT_SQL, (2, "b"))])
+
+    blocker = sqlite3.connect(path, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        assert write_queue.flush() == 0
+        assert len(write_queue) == 2
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    assert write_queue.flush() == 2
+    assert len(write_queue) == 0
+    assert count_rows(path, "items") == 2
+
+
+def test_bad_group_is_dropped_alone(queue):
+    path, write_queue = queue
+    write_queue.enqueue([(INSERT_SQL, (1, "a"))])
+    # Both statements of a group apply together or not at all
+    write_queue.enqueue([(INSERT_SQL, (2, "b")), (INSERT_SQL, (1, "duplicate"))])
+    write_queue.enqueue([(INSERT_SQL, (3, "c"))])
+
+    assert write_queue.flush() == 3
+    assert len(write_queue) == 0
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT id, name FROM items ORDER BY id").fetchall()
+    assert rows == [(1, "a"), (3, "c")]
@@ -0,0 +1,153 @@
+"""Weekly and monthly away totals per guild and user.
+
+close_away_session() adds every closed session to away_weekly and
+away_monthly in the same transaction that writes it. rebuild_period_totals()
+recomputes both from away_time, away_time_rollup and away_daily, for
+backfills or after importing history:
+
+    python -m utils.aggregates [--db loyalty_bot.db] [--guild-id ID]
+"""
+
+import logging
+import argparse
+from datetime import date as Date
+from config import Config
+
+# Period type -> table holding its totals
+PERIOD_TABLES = {"week": "away_weekly", "month": "away_monthly"}
+
+# Adds one closed session to a period row. Runs before the daily upsert, so
+# the join still sees the day's totals without this session and the
+# over-limit delta matches what UPSERT_DAILY_SQL is about to write.
+UPSERT_PERIOD_SQL = """
+    INSERT INTO {table}
+    (guild_id, period, user_id, user_name, session_count, total_minutes,
+     over_limit_minutes, late_count, fee_amount)
+    SELECT :guild_id, :period, :user_id, :user_name, 1, :minutes,
+           MAX(0, COALESCE(d.total_minutes, 0) + :minutes - :max_daily)
+           - COALESCE(d.over_limit_minutes, 0),
+           :fee > 0, :fee
+    FROM (SELECT 1)
+    LEFT JOIN away_daily d
+        ON d.user_id = :user_id AND d.date = :date AND d.guild_id = :guild_id
+    WHERE true
+    ON CONFLICT(guild_id, period, user_id) DO UPDATE SET
+        user_name = excluded.user_name,
+        session_count = session_count + 1,
+        total_minutes = total_minutes + excluded.total_minutes,
+        over_limit_minutes = over_limit_minutes + excluded.over_limit_minutes,
+        late_count = late_count + excluded.late_count,
+        fee_amount = fee_amount + excluded.fee_amount
+"""
+
+# Recomputes a period table from the raw and rolled-up history
+REBUILD_PERIOD_SQL = """
+    INSERT INTO {table}
+    (guild_id, period, user_id, user_name, session_count, total_minutes,
+     over_limit_minutes, late_count, fee_amount)
+    SELECT guild_id, {period}(date), user_id, MAX(user_name), SUM(session_count),
+           SUM(total_minutes), SUM(over_limit_minutes), SUM(late_count),
+           SUM(fee_amount)
+    FROM (
+        SELECT guild_id, date, user_id, user_name, COUNT(*) AS session_count,
+               SUM(actual_minutes) AS total_minutes, 0 AS over_limit_minutes,
+               SUM(fee_amount > 0) AS late_count, SUM(fee_amount) AS fee_amount
+        FROM away_time {where}
+        GROUP BY guild_id, date, user_id
+        UNION ALL
+        SELECT guild_id, date, user_id, user_name, session_count, actual_minutes,
+               0, late_count, fee_amount
+        FROM away_time_rollup {where}
+        UNION ALL
+        SELECT guild_id, date, user_id, user_name, 0, 0, over_limit_minutes, 0, 0
+        FROM away_daily {where}
+    )
+    GROUP BY guild_id, {period}(date), user_id
+"""
+
+
+def week_of(date):
+    """ISO week of a "YYYY-MM-DD" date, e.g. "2024-W07" """
+    year, week, _ = Date.fromisoformat(date).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_of(date):
+    """Month of a "YYYY-MM-DD" date, e.g. "2024-02" """
+    return date[:7]
+
+
+PERIOD_KEYS = {"week": week_of, "month": month_of}
+
+
+def period_upserts(
+    user_id, user_name, guild_id, date, minutes, fee_amount, max_daily_minutes
+):
+    """(sql, params) statements adding one closed session to every period table"""
+    statements = []
+    for period_type, table in PERIOD_TABLES.items():
+        statements.append(
+            (
+                UPSERT_PERIOD_SQL.format(table=table),
+                {
+                    "guild_id": guild_id,
+                    "period": PERIOD_KEYS[period_type](date),
+                    "user_id": user_id,
+                    "user_name": user_name,
+                    "date": date,
+                    "minutes": minutes,
+                    "fee": fee_amount,
+                    "max_daily": max_daily_minutes,
+                },
+            )
+        )
+    return statements
+
+
+def rebuild_period_totals(conn, guild_id=None):
+    """Recompute away_weekly and away_monthly in the caller's transaction.
+
+    Only history still in this database is counted, rows moved to the
+    archive files are not. Returns the number of period rows written.
+    """
+    conn.create_function("week_of", 1, week_of, deterministic=True)
+    conn.create_function("month_of", 1, month_of, deterministic=True)
+
+    where, params = "", ()
+    if guild_id:
+        where, params = "WHERE guild_id = ?", (guild_id,)
+
+    written = 0
+    for period_type, table in PERIOD_TABLES.items():
+        conn.execute(f"DELETE FROM {table} {where}", params)
+        written += conn.execute(
+            REBUILD_PERIOD_SQL.format(
+                table=table, period=f"{period_type}_of", where=where
+            ),
+            params * 3,
+        ).rowcount
+    return written
+
+
+def main(argv=None):
+    from utils.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.aggregates",
+        description="Rebuild the weekly and monthly away totals",
+    )
+    parser.add_argument("--db", default=Config.DB_PATH, help="database file")
+    parser.add_argument("--guild-id", type=int, help="only rebuild this guild")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = DatabaseManager(args.db, pool_size=1)
+    db.initialize()
+    try:
+        db.rebuild_period_totals(args.guild_id)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Append-only history tables that are moved out of the hot database
+ARCHIVED_TABLES = ("away_time", "away_daily", "away_time_rollup")
+
+
+class ArchiveManager:
+    """Moves old history rows into one attached SQLite file per month.
+
+    Rows whose ``date`` is older than ``horizon_days`` are copied to
+    ``<archive_dir>/away_YYYY_MM.db`` and deleted from the hot database, one
+    month per transaction. Reads for an archived day open that month's file
+    read-only, so day-to-day traffic only ever touches the small hot file.
+    """
+
+    def __init__(self, pool, archive_dir, horizon_days):
+        self.pool = pool
+        self.archive_dir = archive_dir
+        self.horizon_days = horizon_days
+        self.logger = logging.getLogger("discord_bot")
+
+    def month_path(self, month):
+        """Archive file for a "YYYY-MM" month"""
+        return os.path.join(self.archive_dir, f"away_{month.replace('-', '_')}.db")
+
+    def cutoff_date(self):
+        cutoff = datetime.now() - timedelta(days=self.horizon_days)
+        return cutoff.strftime("%Y-%m-%d")
+
+    def archive_old_rows(self):
+        """Archive every row older than the horizon; returns {month: rows moved}"""
+        if self.horizon_days <= 0:
+            return {}
+
+        cutoff = self.cutoff_date()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        moved = {}
+
+        with self.pool.connection() as conn:
+            months = [
+                row[0]
+                for row in conn.execute(
+                    """
+                    SELECT DISTINCT substr(date, 1, 7) FROM away_time WHERE date < ?
+                    UNION
+                    SELECT DISTINCT substr(date, 1, 7) FROM away_daily WHERE date < ?
+                    """,
+                    (cutoff, cutoff),
+                )
+            ]
+            for month in sorted(months):
+                moved[month] = self._archive_month(conn, month, cutoff)
+                self.logger.info(f"Archived {moved[month]} rows for {month}")
+
+        return moved
+
+    def _archive_month(self, conn, month, cutoff):
+        # ATTACH can't run inside a transaction, so it wraps the BEGIN
+        conn.execute("ATTACH DATABASE ? AS archive", (self.month_path(month),))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            moved = 0
+            for table in ARCHIVED_TABLES:
+                columns = ", ".join(self._prepare_table(conn, table))
+                where = "WHERE date < ? AND substr(date, 1, 7) = ?"
+                conn.execute(
+                    f"""
+                    INSERT INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table} {where}
+                    """,
+                    (cutoff, month),
+                )
+                moved += conn.execute(
+                    f"DELETE FROM main.{table} {where}", (cutoff, month)
+                ).rowcount
+            conn.commit()
+            return moved
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+    def _prepare_table(self, conn, table):
+        """Create or extend the archive copy of a table; returns its columns"""
+        columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0"
+        )
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS archive.idx_{table}_guild_date_user
+            ON {table} (guild_id, date, user_id)
+            """)
+
+        # Columns added by later migrations are added to old archives too
+        archived = {
+            row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")
+        }
+        for column in columns:
+            if column not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+        return columns
+
+    def read(self, reader, date, *args):
+        """Run ``reader(conn, date, *args)`` against the archive holding ``date``
+
+        Returns None when that month was never archived.
+        """
+        with self.connect(date) as conn:
+            if conn is None:
+                return None
+            return reader(conn, date, *args)
+
+    @contextmanager
+    def connect(self, date):
+        """Read-only connection to the archive holding ``date``, or None"""
+        path = self.month_path(date[:7])
+        if not os.path.exists(path):
+            yield None
+            return
+
+        conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
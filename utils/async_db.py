@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Backend methods that read through the report pool
+REPORT_METHODS = frozenset(
+    {
+        "_fetch_away_data",
+        "get_sessions_between",
+        "get_period_totals",
+    }
+)
+
+
+class AsyncDatabaseManager:
+    """Awaitable facade over a storage backend (see utils.storage).
+
+    Every backend method can be awaited through this wrapper, e.g.
+    ``await db.get_server_settings(guild_id)``. The call runs on a small
+    executor whose threads check connections out of the manager's pool, so
+    sqlite3 never blocks the discord.py event loop. Helpers that don't touch
+    the database can be called directly on ``db.sync``.
+
+    Report reads (REPORT_METHODS and ``run_report()``) run on a second
+    executor sized to the report pool. However many reports are requested,
+    they queue there and never take a thread the away/return path needs.
+    """
+
+    def __init__(self, manager, max_workers=None, report_workers=None):
+        self.sync = manager
+        self.logger = logging.getLogger("discord_bot")
+        # One worker per pooled connection, so a worker never waits on the pool
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or manager.max_workers,
+            thread_name_prefix="db",
+        )
+        self._report_executor = ThreadPoolExecutor(
+            max_workers=report_workers or manager.report_workers,
+            thread_name_prefix="db-report",
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking callable on the database executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def run_report(self, func, *args, **kwargs):
+        """Run a blocking callable that reads through the report pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._report_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        run = self.run_report if name in REPORT_METHODS else self.run
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await run(attr, *args, **kwargs)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def close(self):
+        """Wait for queued database work, then close the backend"""
+        self._report_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        self.sync.close()
+        self.logger.info("Database executor shut down")
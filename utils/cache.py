@@ -0,0 +1,197 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class SettingsCache:
+    """In-process cache of parsed guild settings with a TTL.
+
+    Writers call ``invalidate()`` after committing. Readers take a
+    ``generation()`` token before querying and pass it to ``set()``, so a
+    read that raced with an update cannot put stale settings back.
+    """
+
+    def __init__(self, ttl_seconds=300):
+        self.ttl = ttl_seconds
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, guild_id):
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            return None
+
+        expires_at, settings = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(guild_id, None)
+            return None
+        return settings
+
+    def generation(self, guild_id):
+        return self._generations.get(guild_id, 0)
+
+    def set(self, guild_id, settings, generation):
+        with self._lock:
+            if self._generations.get(guild_id, 0) != generation:
+                return  # Invalidated while the caller was reading
+            self._entries[guild_id] = (time.monotonic() + self.ttl, settings)
+
+    def invalidate(self, guild_id):
+        with self._lock:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            self._entries.pop(guild_id, None)
+
+
+class ActiveSessionIndex:
+    """Authoritative in-memory copy of active_away_sessions.
+
+    Keyed by ``(guild_id, user_id)``. It is loaded from the table once and
+    then updated alongside every insert and delete, so looking up whether a
+    user is away never has to touch the database.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sessions):
+        with self._lock:
+            self._sessions = {(s["guild_id"], s["user_id"]): s for s in sessions}
+            self.loaded = True
+
+    def get(self, guild_id, user_id):
+        session = self._sessions.get((guild_id, user_id))
+        # Hand out a copy so callers can't change the index by accident
+        return dict(session) if session else None
+
+    def put(self, session):
+        with self._lock:
+            self._sessions[(session["guild_id"], session["user_id"])] = session
+
+    def remove(self, guild_id, user_id):
+        with self._lock:
+            return self._sessions.pop((guild_id, user_id), None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class DailyTotalsCache:
+    """Today's away_daily totals per ``(guild_id, user_id)``.
+
+    Entries are warmed lazily from the database and then kept current as
+    sessions close. The whole map is dropped when the date rolls over, so it
+    only ever holds a single day.
+    """
+
+    def __init__(self):
+        self._date = None
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _roll_over(self, date):
+        # Caller holds the lock. Only move forward; older dates aren't cached.
+        if self._date is None or date > self._date:
+            self._date = date
+            self._totals = {}
+        return date == self._date
+
+    def get(self, date, guild_id, user_id):
+        with self._lock:
+            if not self._roll_over(date):
+                return None
+            totals = self._totals.get((guild_id, user_id))
+            return dict(totals) if totals else None
+
+    def warm(self, date, guild_id, user_id, totals):
+        """Store totals read from the database unless a newer value is cached"""
+        with self._lock:
+            if self._roll_over(date):
+                self._totals.setdefault((guild_id, user_id), dict(totals))
+
+    def add_minutes(
+        self, date, guild_id, user_id, minutes, max_daily_minutes, fee_percentage
+    ):
+        """Apply a closed session the same way the away_daily UPSERT does"""
+        with self._lock:
+            if not self._roll_over(date):
+                return None
+            totals = self._totals.setdefault(
+                (guild_id, user_id),
+                {"total_minutes": 0, "over_limit_minutes": 0, "fee_amount": 0},
+            )
+            totals["total_minutes"] += minutes
+            totals["over_limit_minutes"] = max(
+                0, totals["total_minutes"] - max_daily_minutes
+            )
+            totals["fee_amount"] = totals["over_limit_minutes"] * fee_percentage
+            return totals["over_limit_minutes"], totals["fee_amount"]
+
+
+class ReportCache:
+    """Bounded LRU of report data for past days.
+
+    Keyed by ``(guild_id, date, user_id)``, with ``user_id`` None for the
+    admin view. Past days rarely change, so entries have no TTL; writers
+    call ``invalidate(guild_id, date)`` for the day they touched, and
+    readers pass a ``generation()`` token to ``put()`` as in SettingsCache.
+    ``hits`` and ``misses`` count lookups since startup.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0  # Bumped by clear()
+        self._lock = threading.Lock()
+
+    def get(self, guild_id, date, user_id=None):
+        key = (guild_id, date, user_id)
+        with self._lock:
+            records = self._entries.get(key)
+            if records is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return records
+
+    def generation(self, guild_id, date):
+        return self._epoch, self._generations.get((guild_id, date), 0)
+
+    def put(self, guild_id, date, user_id, records, generation):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if self.generation(guild_id, date) != generation:
+                return  # The day was written while the caller was reading
+            self._entries[(guild_id, date, user_id)] = records
+            self._entries.move_to_end((guild_id, date, user_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, guild_id, date):
+        with self._lock:
+            day = (guild_id, date)
+            self._generations[day] = self._generations.get(day, 0) + 1
+            for key in [key for key in self._entries if key[:2] == day]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry, e.g. after history was moved or pruned"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
@@ -2,14 +2,17 @@ import discord
 import logging
 from discord import app_commands
 from cogs.embed import EmbedHandler
+from config import Config
+from utils.settings import parse_phrases
 
 logger = logging.getLogger("discord_bot")
 
 
 class MyCommands:
-    def __init__(self, bot):
-        """Initialize the commands class with the bot instance."""
+    def __init__(self, bot, db):
+        """Initialize the commands class with the bot instance and shared database."""
         self.bot = bot
+        self.db = db
         self._register_commands()
 
     def _register_commands(self):
@@ -59,9 +62,16 @@ class MyCommands:
     def _register_moderation_commands(self):
         pass
 
+    async def _reload_message_filters(self, guild_id):
+        """Make on_message pick up changed return phrases or tracked channels"""
+        tracker = self.bot.get_cog("LoyaltyTracker")
+        if tracker:
+            await tracker.load_guild_filters(guild_id)
+
     # Define the setup method
     async def setup(self, interaction: discord.Interaction):
         """Handle the setup command."""
+        db = self.db
 
         class SetupModal(discord.ui.Modal, title="Bot Setup"):
             prefix = discord.ui.TextInput(
@@ -102,23 +112,16 @@ class MyCommands:
 
             async def on_submit(self, modal_interaction: discord.Interaction):
                 try:
-                    from utils.db_manager import DatabaseManager
-
-                    db = DatabaseManager()
                     guild = modal_interaction.guild
 
-                    # Update prefix
-                    db.update_server_setting(
-                        guild.id, "command_prefix", self.prefix.value
-                    )
+                    # Collect every field first, then save them in one write
+                    updates = {"command_prefix": self.prefix.value}
 
-                    # Validate and update grace period
+                    # Validate grace period
                     try:
                         grace_minutes = int(self.grace_period.value)
                         if 0 <= grace_minutes <= 60:
-                            db.update_server_setting(
-                                guild.id, "grace_period_minutes", grace_minutes
-                            )
+                            updates["grace_period_minutes"] = grace_minutes
                         else:
                             await modal_interaction.response.send_message(
                                 "Grace period must be between 0 and 60 minutes. Using default value.",
@@ -132,12 +135,10 @@ class MyCommands:
                         )
                         return
 
-                    # Validate and update fee percentage
+                    # Validate fee percentage
                     try:
                         fee_value = float(self.fee_percentage.value)
-                        db.update_server_setting(
-                            guild.id, "fee_percentage_per_minute", fee_value
-                        )
+                        updates["fee_percentage_per_minute"] = fee_value
                     except ValueError:
                         await modal_interaction.response.send_message(
                             "Invalid fee percentage value. Using default value.",
@@ -145,26 +146,24 @@ class MyCommands:
                         )
                         return
 
-                    # Validate and update max single away time
+                    # Validate max single away time
                     if self.max_single_away.value:
                         try:
                             max_single = int(self.max_single_away.value)
-                            db.update_server_setting(
-                                guild.id, "max_single_away_minutes", max_single
-                            )
+                            updates["max_single_away_minutes"] = max_single
                         except ValueError:
                             pass  # Use default if invalid
 
-                    # Validate and update max daily away time
+                    # Validate max daily away time
                     if self.max_daily_away.value:
                         try:
                             max_daily = int(self.max_daily_away.value)
-                            db.update_server_setting(
-                                guild.id, "max_daily_away_minutes", max_daily
-                            )
+                            updates["max_daily_away_minutes"] = max_daily
                         except ValueError:
                             pass  # Use default if invalid
 
+                    await db.update_server_settings(guild.id, updates)
+
                     await modal_interaction.response.send_message(
                         f"# ✅ Initial settings saved!\n"
                         f"• Prefix: `{self.prefix.value}`\n"
@@ -210,13 +209,10 @@ class MyCommands:
             async def channel_select(
                 self, select_interaction: discord.Interaction, select
             ):
-                from utils.db_manager import DatabaseManager
-
-                db = DatabaseManager()
                 selected_channel = select.values[0]
 
                 # Update the announcement channel in the database
-                db.update_server_setting(
+                await db.update_server_setting(
                     self.guild.id, "channel_id", selected_channel.id
                 )
 
@@ -228,7 +224,7 @@ class MyCommands:
                 )
 
                 # Create settings embed for feedback
-                settings = db.get_server_settings(self.guild.id)
+                settings = await db.get_server_settings(self.guild.id)
                 embed = EmbedHandler.bot_setup_complete_embed(
                     settings, selected_channel
                 )
@@ -274,17 +270,15 @@ class MyCommands:
 
             async def on_submit(self, modal_interaction: discord.Interaction):
                 try:
-                    from utils.db_manager import DatabaseManager
-
-                    db = DatabaseManager()
                     guild = modal_interaction.guild
 
                     # Update work hours
-                    db.update_server_setting(
-                        guild.id, "work_start_hour", self.work_start_time.value
-                    )
-                    db.update_server_setting(
-                        guild.id, "work_end_hour", self.work_end_time.value
+                    await db.update_server_settings(
+                        guild.id,
+                        {
+                            "work_start_hour": self.work_start_time.value,
+                            "work_end_hour": self.work_end_time.value,
+                        },
                     )
 
                     await modal_interaction.response.send_message(
@@ -357,10 +351,9 @@ class MyCommands:
 
     # Register a command to view and update settings
     async def settings(self, interaction: discord.Interaction):
-        from utils.db_manager import DatabaseManager
-
-        db = DatabaseManager()
-        settings = db.get_server_settings(interaction.guild.id)
+        db = self.db
+        reload_message_filters = self._reload_message_filters
+        settings = await db.get_server_settings(interaction.guild.id)
 
         embed = EmbedHandler.settings_embed(settings, interaction)
 
@@ -386,7 +379,7 @@ class MyCommands:
                     )
 
                     async def on_submit(self, modal_interaction: discord.Interaction):
-                        db.update_server_setting(
+                        await db.update_server_setting(
                             interaction.guild.id,
                             "command_prefix",
                             self.prefix.value,
@@ -420,7 +413,7 @@ class MyCommands:
                         self, select_interaction: discord.Interaction, select
                     ):
                         selected_channel = select.values[0]
-                        db.update_server_setting(
+                        await db.update_server_setting(
                             interaction.guild.id,
                             "channel_id",
                             selected_channel.id,
@@ -457,7 +450,7 @@ class MyCommands:
                         try:
                             grace_minutes = int(self.grace_period.value)
                             if 0 <= grace_minutes <= 60:
-                                db.update_server_setting(
+                                await db.update_server_setting(
                                     interaction.guild.id,
                                     "grace_period_minutes",
                                     grace_minutes,
@@ -513,29 +506,21 @@ class MyCommands:
                         try:
                             # Update fee percentage
                             fee_value = float(self.fee_percentage.value)
-                            db.update_server_setting(
-                                interaction.guild.id,
-                                "fee_percentage_per_minute",
-                                fee_value,
-                            )
+                            updates = {"fee_percentage_per_minute": fee_value}
 
                             # Update max single away time if provided
                             if self.max_single_away.value:
                                 max_single = int(self.max_single_away.value)
-                                db.update_server_setting(
-                                    interaction.guild.id,
-                                    "max_single_away_minutes",
-                                    max_single,
-                                )
+                                updates["max_single_away_minutes"] = max_single
 
                             # Update max daily away time if provided
                             if self.max_daily_away.value:
                                 max_daily = int(self.max_daily_away.value)
-                                db.update_server_setting(
-                                    interaction.guild.id,
-                                    "max_daily_away_minutes",
-                                    max_daily,
-                                )
+                                updates["max_daily_away_minutes"] = max_daily
+
+                            await db.update_server_settings(
+                                interaction.guild.id, updates
+                            )
 
                             await modal_interaction.response.send_message(
                                 f"Fee settings updated:\n"
@@ -578,15 +563,12 @@ class MyCommands:
 
                     async def on_submit(self, modal_interaction: discord.Interaction):
                         # Update work hours
-                        db.update_server_setting(
-                            interaction.guild.id,
-                            "work_start_hour",
-                            self.work_start_time.value,
-                        )
-                        db.update_server_setting(
+                        await db.update_server_settings(
                             interaction.guild.id,
-                            "work_end_hour",
-                            self.work_end_time.value,
+                            {
+                                "work_start_hour": self.work_start_time.value,
+                                "work_end_hour": self.work_end_time.value,
+                            },
                         )
 
                         await modal_interaction.response.send_message(
@@ -598,6 +580,84 @@ class MyCommands:
 
                 await button_interaction.response.send_modal(WorkHoursModal())
 
+            @discord.ui.button(
+                label="Edit Return Phrases", style=discord.ButtonStyle.primary
+            )
+            async def edit_return_phrases(
+                self,
+                button_interaction: discord.Interaction,
+                button: discord.ui.Button,
+            ):
+                # Create a modal for editing the phrases that mark a return
+                class ReturnPhrasesModal(discord.ui.Modal, title="Edit Return Phrases"):
+                    phrases = discord.ui.TextInput(
+                        label="Return phrases (comma-separated)",
+                        style=discord.TextStyle.paragraph,
+                        placeholder="back, returned, i'm back",
+                        default=", ".join(settings.return_phrase_list),
+                        max_length=500,
+                        required=False,
+                    )
+
+                    async def on_submit(self, modal_interaction: discord.Interaction):
+                        # Leaving it empty goes back to the default phrases
+                        phrases = ", ".join(parse_phrases(self.phrases.value)) or None
+                        await db.update_server_setting(
+                            interaction.guild.id, "return_phrases", phrases
+                        )
+                        await reload_message_filters(interaction.guild.id)
+                        await modal_interaction.response.send_message(
+                            f"Return phrases updated to: "
+                            f"`{phrases or Config.RETURN_PHRASES}`\n"
+                            "Phrases only match as whole words.",
+                            ephemeral=True,
+                        )
+
+                await button_interaction.response.send_modal(ReturnPhrasesModal())
+
+            @discord.ui.button(
+                label="Edit Tracked Channels", style=discord.ButtonStyle.primary
+            )
+            async def edit_tracked_channels(
+                self,
+                button_interaction: discord.Interaction,
+                button: discord.ui.Button,
+            ):
+                # Create a view with a multi-channel select menu
+                class TrackedChannelsView(discord.ui.View):
+                    def __init__(self):
+                        super().__init__(timeout=60)  # 1 minute timeout
+
+                    @discord.ui.select(
+                        cls=discord.ui.ChannelSelect,
+                        channel_types=[discord.ChannelType.text],
+                        placeholder="Select channels to track (none for all)",
+                        min_values=0,
+                        max_values=25,
+                    )
+                    async def channel_select(
+                        self, select_interaction: discord.Interaction, select
+                    ):
+                        # No selection goes back to tracking every channel
+                        channel_ids = ",".join(str(c.id) for c in select.values)
+                        await db.update_server_setting(
+                            interaction.guild.id,
+                            "tracked_channels",
+                            channel_ids or None,
+                        )
+                        await reload_message_filters(interaction.guild.id)
+                        mentions = ", ".join(c.mention for c in select.values)
+                        await select_interaction.response.send_message(
+                            f"Tracked channels updated to: {mentions or 'all channels'}",
+                            ephemeral=True,
+                        )
+
+                await button_interaction.response.send_message(
+                    "Select the channels where away and return messages count:",
+                    view=TrackedChannelsView(),
+                    ephemeral=True,
+                )
+
         await interaction.response.send_message(
             embed=embed, view=SettingsView(), ephemeral=True
         )
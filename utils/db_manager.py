@@ -1,14 +1,114 @@
-import sqlite3
 import logging
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
+from pathlib import Path
 from config import Config
+from utils.aggregates import PERIOD_TABLES, period_upserts, rebuild_period_totals
+from utils.archive import ArchiveManager
+from utils.cache import (
+    ActiveSessionIndex,
+    DailyTotalsCache,
+    ReportCache,
+    SettingsCache,
+)
+from utils.db_pool import ConnectionPool
+from utils.migrations import run_migrations
+from utils.retention import RetentionManager
+from utils.settings import ServerSettings
+from utils.storage import SETTINGS_COLUMNS, StorageBackend, clock_time, iter_rows
+from utils.write_behind import WriteBehindQueue
 import traceback
 
 
-class DatabaseManager:
-    def __init__(self, db_path="loyalty_bot.db"):
-        self.db_path = db_path
+INSERT_SESSION_SQL = """
+    INSERT INTO away_time
+    (user_id, user_name, guild_id, date, start_time, end_time, start_ts, end_ts,
+     expected_minutes, actual_minutes, fee_amount)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Adds to the day's totals; SET expressions see the row as it was before
+UPSERT_DAILY_SQL = """
+    INSERT INTO away_daily
+    (user_id, user_name, guild_id, date, total_minutes, over_limit_minutes, fee_amount)
+    VALUES (
+        :user_id, :user_name, :guild_id, :date, :minutes,
+        MAX(0, :minutes - :max_daily),
+        MAX(0, :minutes - :max_daily) * :fee_percentage
+    )
+    ON CONFLICT(user_id, date, guild_id) DO UPDATE SET
+        total_minutes = total_minutes + :minutes,
+        over_limit_minutes = MAX(0, total_minutes + :minutes - :max_daily),
+        fee_amount = MAX(0, total_minutes + :minutes - :max_daily) * :fee_percentage
+"""
+
+UPSERT_ACTIVE_SQL = """
+    INSERT INTO active_away_sessions
+    (user_id, user_name, guild_id, start_time, start_ts, expected_minutes)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, guild_id) DO UPDATE SET
+        start_time = excluded.start_time,
+        start_ts = excluded.start_ts,
+        expected_minutes = excluded.expected_minutes
+"""
+
+DELETE_ACTIVE_SQL = """
+    DELETE FROM active_away_sessions
+    WHERE user_id = ? AND guild_id = ?
+"""
+
+
+class DatabaseManager(StorageBackend):
+    """SQLite storage backend"""
+
+    def __init__(self, db_path=None, archive_dir=None, pool_size=None):
+        self.db_path = db_path or Config.DB_PATH
         self.logger = logging.getLogger("discord_bot")
+        self.pool = ConnectionPool(
+            self.db_path,
+            size=pool_size or Config.DB_POOL_SIZE,
+            pragmas={
+                # Must come first: it only takes effect on an empty file,
+                # see RetentionManager for existing databases
+                "auto_vacuum": "INCREMENTAL",
+                "journal_mode": Config.DB_JOURNAL_MODE,
+                "synchronous": Config.DB_SYNCHRONOUS,
+                "cache_size": Config.DB_CACHE_SIZE,
+                "mmap_size": Config.DB_MMAP_SIZE,
+            },
+        )
+        # Reports read through their own read-only connections, so a long
+        # admin report never takes a connection the away/return path needs
+        self.report_pool = ConnectionPool(
+            Path(self.db_path).resolve().as_uri() + "?mode=ro",
+            size=Config.DB_REPORT_POOL_SIZE,
+            pragmas={
+                "query_only": "ON",
+                "cache_size": Config.DB_CACHE_SIZE,
+                "mmap_size": Config.DB_MMAP_SIZE,
+            },
+            uri=True,
+        )
+        self.archive = ArchiveManager(
+            self.pool, archive_dir or Config.ARCHIVE_DIR, Config.ARCHIVE_AFTER_DAYS
+        )
+        self.retention = RetentionManager(
+            self.pool,
+            Config.RETENTION_DAYS,
+            batch_size=Config.RETENTION_BATCH_SIZE,
+            vacuum_pages=Config.RETENTION_VACUUM_PAGES,
+        )
+        self.settings_cache = SettingsCache(ttl_seconds=Config.SETTINGS_CACHE_TTL)
+        self.active_sessions = ActiveSessionIndex()
+        self.daily_totals = DailyTotalsCache()
+        self.report_cache = ReportCache(max_entries=Config.REPORT_CACHE_SIZE)
+        self.write_queue = None
+        if Config.DB_WRITE_BEHIND:
+            self.write_queue = WriteBehindQueue(
+                self.pool,
+                flush_interval_ms=Config.DB_WRITE_BEHIND_INTERVAL_MS,
+                max_batch=Config.DB_WRITE_BEHIND_MAX_BATCH,
+            )
         self.MAX_DAILY_AWAY_MINUTES = Config.MAX_DAILY_AWAY_MINUTES
         self.FEE_PERCENTAGE_PER_MINUTE = Config.FEE_PERCENTAGE_PER_MINUTE
         self.WORK_START_TIME = Config.WORK_START_TIME
@@ -17,125 +117,172 @@ class DatabaseManager:
     def initialize(self):
         """Initialize database tables for loyalty tracking"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS server_settings (
-                    guild_id INTEGER PRIMARY KEY,
-                    command_prefix TEXT DEFAULT '!',
-                    channel_id INTEGER,
-                    grace_period_minutes INTEGER DEFAULT 1,
-                    fee_percentage_per_minute REAL DEFAULT 0.0007,
-                    max_single_away_minutes INTEGER DEFAULT 40,
-                    max_daily_away_minutes INTEGER DEFAULT 90,
-                    work_start_hour INTEGER DEFAULT 9,
-                    work_end_hour INTEGER DEFAULT 17
-                )
-                """
+            with self.get_connection() as conn:
+                self._create_tables(conn)
+                version = run_migrations(conn)
+                # on_ready runs this again after reconnects; by then the index
+                # is ahead of the table (queued writes), so it is loaded once
+                if not self.active_sessions.loaded:
+                    self._load_active_sessions(conn)
+            self.logger.info(
+                f"Loyalty tracking database tables initialized (schema v{version})"
             )
+        except Exception as e:
+            self.logger.error(f"Error initializing loyalty tracking database: {e}")
 
-            # Table to track user away time
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS away_time (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    start_time TEXT NOT NULL,
-                    end_time TEXT,
-                    expected_minutes INTEGER NOT NULL,
-                    actual_minutes INTEGER,
-                    fee_amount REAL DEFAULT 0
-                )
-                """
+    def _create_tables(self, conn):
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS server_settings (
+                guild_id INTEGER PRIMARY KEY,
+                command_prefix TEXT DEFAULT '!',
+                channel_id INTEGER,
+                grace_period_minutes INTEGER DEFAULT 1,
+                fee_percentage_per_minute REAL DEFAULT 0.0007,
+                max_single_away_minutes INTEGER DEFAULT 40,
+                max_daily_away_minutes INTEGER DEFAULT 90,
+                work_start_hour INTEGER DEFAULT 9,
+                work_end_hour INTEGER DEFAULT 17
             )
+            """
+        )
 
-            # Table to track daily totals
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS away_daily (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    total_minutes INTEGER DEFAULT 0,
-                    over_limit_minutes INTEGER DEFAULT 0,
-                    fee_amount REAL DEFAULT 0,
-                    UNIQUE(user_id, date, guild_id)
-                );
-                """
+        # Table to track user away time
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS away_time (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                guild_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT,
+                expected_minutes INTEGER NOT NULL,
+                actual_minutes INTEGER,
+                fee_amount REAL DEFAULT 0
             )
+            """
+        )
 
-            # Table to track active away sessions
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS active_away_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    start_time TEXT NOT NULL,
-                    expected_minutes INTEGER NOT NULL,
-                    UNIQUE(user_id, guild_id)
-                )
-                """
+        # Table to track daily totals
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS away_daily (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                guild_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                total_minutes INTEGER DEFAULT 0,
+                over_limit_minutes INTEGER DEFAULT 0,
+                fee_amount REAL DEFAULT 0,
+                UNIQUE(user_id, date, guild_id)
+            );
+            """
+        )
+
+        # Table to track active away sessions
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS active_away_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                guild_id INTEGER NOT NULL,
+                start_time TEXT NOT NULL,
+                expected_minutes INTEGER NOT NULL,
+                UNIQUE(user_id, guild_id)
             )
+            """
+        )
 
-            conn.commit()
-            conn.close()
-            self.logger.info("Loyalty tracking database tables initialized")
-        except Exception as e:
-            self.logger.error(f"Error initializing loyalty tracking database: {e}")
+        conn.commit()
+
+    def _load_active_sessions(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM active_away_sessions")
+        columns = [description[0] for description in cursor.description]
+        sessions = []
+        for row in cursor.fetchall():
+            session = dict(zip(columns, row))
+            session.pop("id", None)
+            session["start_time"] = datetime.fromtimestamp(session["start_ts"]).time()
+            sessions.append(session)
+
+        self.active_sessions.load(sessions)
+        self.logger.info(f"Loaded {len(sessions)} active away sessions")
+
+    @property
+    def max_workers(self):
+        return self.pool.size
+
+    @property
+    def report_workers(self):
+        return self.report_pool.size
 
     def get_connection(self):
-        try:
-            conn = sqlite3.connect(self.db_path)
-            return conn
-        except Exception as e:
-            self.logger.error(f"Error connecting to database: {e}")
-            return None
+        """Check out a pooled connection, use as ``with db.get_connection() as conn``"""
+        return self.pool.connection()
+
+    def close(self):
+        """Flush queued writes and close all pooled connections"""
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.report_pool.close()
+        self.pool.close()
 
     def save_guild_config(self, guild_id, config_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute(
-            """INSERT OR REPLACE INTO server_settings 
-                        (guild_id, command_prefix, channel_id, 
-                        grace_period_minutes, fee_percentage_per_minute, 
-                        max_single_away_minutes, max_daily_away_minutes,
-                        work_start_hour, work_end_hour)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                guild_id,
-                config_data.get("command_prefix", Config.PREFIX),
-                config_data.get("channel_id", Config.CHANNEL_ID),
-                config_data.get("grace_period_minutes", Config.GRACE_PERIOD_MINUTES),
-                config_data.get(
-                    "fee_percentage_per_minute", Config.FEE_PERCENTAGE_PER_MINUTE
-                ),
-                config_data.get(
-                    "max_single_away_minutes", Config.MAX_SINGLE_AWAY_MINUTES
-                ),
-                config_data.get(
-                    "max_daily_away_minutes", Config.MAX_DAILY_AWAY_MINUTES
+            cursor.execute(
+                """INSERT OR REPLACE INTO server_settings 
+                            (guild_id, command_prefix, channel_id, 
+                            grace_period_minutes, fee_percentage_per_minute, 
+                            max_single_away_minutes, max_daily_away_minutes,
+                            work_start_hour, work_end_hour)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    guild_id,
+                    config_data.get("command_prefix", Config.PREFIX),
+                    config_data.get("channel_id", Config.CHANNEL_ID),
+                    config_data.get(
+                        "grace_period_minutes", Config.GRACE_PERIOD_MINUTES
+                    ),
+                    config_data.get(
+                        "fee_percentage_per_minute", Config.FEE_PERCENTAGE_PER_MINUTE
+                    ),
+                    config_data.get(
+                        "max_single_away_minutes", Config.MAX_SINGLE_AWAY_MINUTES
+                    ),
+                    config_data.get(
+                        "max_daily_away_minutes", Config.MAX_DAILY_AWAY_MINUTES
+                    ),
+                    config_data.get("work_start_hour", 9),
+                    config_data.get("work_end_hour", 17),
                 ),
-                config_data.get("work_start_hour", 9),
-                config_data.get("work_end_hour", 17),
-            ),
-        )
-        conn.commit()
-        conn.close()
+            )
+            conn.commit()
+        self.settings_cache.invalidate(guild_id)
 
     def get_server_settings(self, guild_id, conn=None):
-        """Get settings for a specific server, or create with defaults if not exists"""
-        connection = conn or sqlite3.connect(self.db_path)
-        cursor = connection.cursor()
+        """Get parsed settings for a specific server, or defaults if not configured"""
+        if conn is None:
+            settings = self.settings_cache.get(guild_id)
+            if settings is not None:
+                return settings
+
+            generation = self.settings_cache.generation(guild_id)
+            with self.get_connection() as connection:
+                settings = self.get_server_settings(guild_id, conn=connection)
+            if settings is not None:
+                self.settings_cache.set(guild_id, settings, generation)
+            return settings
+
+        cursor = conn.cursor()
 
         try:
             # Try to fetch the server settings
@@ -146,34 +293,24 @@ class DatabaseManager:
             server = cursor.fetchone()
 
             if not server:
-                return {
-                    "command_prefix": Config.PREFIX,
-                    "channel_id": Config.CHANNEL_ID,
-                    "grace_period_minutes": Config.GRACE_PERIOD_MINUTES,
-                    "fee_percentage_per_minute": Config.FEE_PERCENTAGE_PER_MINUTE,
-                    "max_single_away_minutes": Config.MAX_SINGLE_AWAY_MINUTES,
-                    "max_daily_away_minutes": Config.MAX_DAILY_AWAY_MINUTES,
-                    "work_start_hour": Config.WORK_START_TIME,
-                    "work_end_hour": Config.WORK_END_TIME,
-                }
+                return ServerSettings.from_row(guild_id)
 
-            # Convert to dictionary
+            # Convert to a parsed settings object
             columns = [description[0] for description in cursor.description]
-            server_dict = dict(zip(columns, server))
+            settings = ServerSettings.from_row(guild_id, dict(zip(columns, server)))
 
         except Exception as e:
-            print(f"Error while fetching or inserting server settings: {e}")
-            server_dict = None
+            self.logger.error(f"Error while fetching server settings: {e}")
+            settings = None
 
-        finally:
-            if not conn:
-                connection.close()
-        return server_dict
+        return settings
 
     def get_server_setting(self, guild_id, setting_name, conn=None):
+        if conn is None:
+            with self.get_connection() as connection:
+                return self.get_server_setting(guild_id, setting_name, conn=connection)
 
-        connection = conn or sqlite3.connect(self.db_path)
-        cursor = connection.cursor()
+        cursor = conn.cursor()
 
         try:
             # Fetch the specific setting from the database
@@ -190,95 +327,111 @@ class DatabaseManager:
                 return Config.__dict__.get(setting_name.upper())
 
         except Exception as e:
-            print(f"Error while fetching server setting '{setting_name}': {e}")
+            self.logger.error(
+                f"Error while fetching server setting '{setting_name}': {e}"
+            )
             return None
 
-        finally:
-            if not conn:
-                connection.close()
+    def update_server_settings(self, guild_id, settings):
+        """
+        Update several settings for a server in one statement and transaction.
 
-    def update_server_setting(self, guild_id, setting, value):
-        """Update a specific setting for a server"""
-        print(f"Updating setting: {setting} to {value}")
-        self.conn = sqlite3.connect(self.db_path)
-        cursor = self.conn.cursor()
+        Args:
+            guild_id (int): The ID of the guild.
+            settings (dict): Column name to new value, see SETTINGS_COLUMNS.
 
-        try:
-            # Ensure the server exists in our database, reuse the same connection
-            self.get_server_settings(guild_id, conn=self.conn)
+        Returns:
+            bool: True if the settings were saved.
+        """
+        unknown = set(settings) - set(SETTINGS_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown server settings: {', '.join(sorted(unknown))}")
+        if not settings:
+            return True
 
-            # Update the setting
-            cursor.execute(
-                f"""
-                UPDATE server_settings SET {setting} = ? WHERE guild_id = ?
-                """,
-                (value, guild_id),
-            )
+        self.logger.debug(f"Updating settings for guild {guild_id}: {settings}")
+        columns = list(settings)
 
-            self.conn.commit()
+        try:
+            with self.get_connection() as conn:
+                # Creates the row with table defaults if the guild has none yet
+                conn.execute(
+                    f"""
+                    INSERT INTO server_settings (guild_id, {", ".join(columns)})
+                    VALUES (?, {", ".join("?" for _ in columns)})
+                    ON CONFLICT(guild_id) DO UPDATE SET
+                    {", ".join(f"{column} = excluded.{column}" for column in columns)}
+                    """,
+                    (guild_id, *settings.values()),
+                )
+                conn.commit()
 
         except Exception as e:
-            print(f"Error updating server setting: {e}")
+            self.logger.error(f"Error updating server settings: {e}")
             return False
 
         finally:
-            if self.conn:
-                self.conn.close()
-                print("Connection closed after updating")
+            self.settings_cache.invalidate(guild_id)
 
         return True
 
-    def is_work_hours(self, settings):
-        """Check if current time is within work hours (e.g., 08:00 - 16:00 on weekdays)."""
-        now = datetime.now()
-        current_time = now.time()
-
-        # Check if it's a weekday (0 = Monday, 4 = Friday)
-        is_weekday = now.weekday() < 5
-
-        # Convert work_start_hour and work_end_hour from strings to datetime.time objects
-        try:
-            work_start_hour = datetime.strptime(
-                settings["work_start_hour"], "%H:%M"
-            ).time()
-            work_end_hour = datetime.strptime(settings["work_end_hour"], "%H:%M").time()
-
-        except ValueError as e:
-            self.logger.error(f"Error parsing work hours: {e}")
-            return False
-
-        # Check if current time is between work hours
-        is_work_time = work_start_hour <= current_time <= work_end_hour
-
-        return is_weekday and is_work_time
-
     def get_today_away_time(self, user_id, guild_id):
         """Get total away time for user today in a specific guild"""
         today = datetime.now().strftime("%Y-%m-%d")
 
         try:
-            conn = self.get_connection()
+            return self._get_daily_totals(user_id, guild_id, today)["total_minutes"]
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error getting daily away time: {e}")
+            return 0
+
+    def _get_daily_totals(self, user_id, guild_id, today):
+        """Today's totals for a user, from the cache or warmed from away_daily"""
+        totals = self.daily_totals.get(today, guild_id, user_id)
+        if totals is not None:
+            return totals
+
+        self._sync_pending_writes()
+        with self.get_connection() as conn:
             cursor = conn.cursor()
 
             # Get from daily tracking
             cursor.execute(
                 """
-                SELECT total_minutes FROM away_daily
+                SELECT total_minutes, over_limit_minutes, fee_amount FROM away_daily
                 WHERE user_id = ? AND date = ? AND guild_id = ?
                 """,
                 (user_id, today, guild_id),
             )
 
-            result = cursor.fetchone()
-            conn.close()
+            result = cursor.fetchone() or (0, 0, 0)
 
-            if result:
-                return result[0]
-            return 0
-        except Exception as e:
-            traceback.print_exc()
-            self.logger.error(f"Error getting daily away time: {e}")
-            return 0
+        totals = dict(
+            zip(("total_minutes", "over_limit_minutes", "fee_amount"), result)
+        )
+        self.daily_totals.warm(today, guild_id, user_id, totals)
+        return self.daily_totals.get(today, guild_id, user_id) or totals
+
+    def _add_daily_minutes(
+        self,
+        user_id,
+        guild_id,
+        today,
+        totals,
+        minutes,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        """Apply a written session to the cached totals; returns (over_limit, fee)"""
+        result = self.daily_totals.add_minutes(
+            today, guild_id, user_id, minutes, max_daily_minutes, fee_percentage
+        )
+        if result is None:
+            # The day rolled over mid-call, work from the totals read earlier
+            over_limit = max(0, totals["total_minutes"] + minutes - max_daily_minutes)
+            result = over_limit, over_limit * fee_percentage
+        return result
 
     def update_daily_totals(
         self,
@@ -293,62 +446,32 @@ class DatabaseManager:
         today = datetime.now().strftime("%Y-%m-%d")
 
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            totals = self._get_daily_totals(user_id, guild_id, today)
 
-            # Get current daily total
-            cursor.execute(
-                """
-                SELECT total_minutes FROM away_daily
-                WHERE user_id = ? AND date = ? AND guild_id = ?
-                """,
-                (user_id, today, guild_id),
-            )
-
-            result = cursor.fetchone()
-
-            if result:
-                # Update existing record
-                new_total = result[0] + minutes_away
-                over_limit = max(0, new_total - max_daily_minutes)
-                fee_amount = over_limit * fee_percentage
-
-                cursor.execute(
-                    """
-                    UPDATE away_daily
-                    SET total_minutes = ?,
-                        over_limit_minutes = ?,
-                        fee_amount = ?
-                    WHERE user_id = ? AND date = ? AND guild_id = ?
-                    """,
-                    (new_total, over_limit, fee_amount, user_id, today, guild_id),
-                )
-            else:
-                # Create new record
-                over_limit = max(0, minutes_away - max_daily_minutes)
-                fee_amount = over_limit * fee_percentage
-
-                cursor.execute(
-                    """
-                    INSERT INTO away_daily
-                    (user_id, user_name, guild_id, date, total_minutes, over_limit_minutes, fee_amount)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
+            self._write(
+                [
+                    self._daily_upsert(
                         user_id,
                         user_name,
                         guild_id,
                         today,
                         minutes_away,
-                        over_limit,
-                        fee_amount,
-                    ),
-                )
-
-            conn.commit()
-            conn.close()
+                        max_daily_minutes,
+                        fee_percentage,
+                    )
+                ]
+            )
+            self.report_cache.invalidate(guild_id, today)
 
-            return over_limit, fee_amount
+            return self._add_daily_minutes(
+                user_id,
+                guild_id,
+                today,
+                totals,
+                minutes_away,
+                max_daily_minutes,
+                fee_percentage,
+            )
         except Exception as e:
             traceback.print_exc()
             self.logger.error(f"Error updating daily totals: {e}")
@@ -359,40 +482,35 @@ class DatabaseManager:
         user_id,
         user_name,
         guild_id,
-        start_time,
-        end_time,
+        start_ts,
+        end_ts,
         expected_minutes,
         actual_minutes,
         fee_amount,
     ):
-        """Record a complete away session in the database for a specific guild"""
+        """Record a complete away session in the database for a specific guild
+
+        start_ts and end_ts are epoch seconds.
+        """
         today = datetime.now().strftime("%Y-%m-%d")
-        
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
 
-            cursor.execute(
-                """
-                INSERT INTO away_time
-                (user_id, user_name, guild_id, date, start_time, end_time, expected_minutes, actual_minutes, fee_amount)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    user_id,
-                    user_name,
-                    guild_id,
-                    today,
-                    start_time,
-                    end_time,
-                    expected_minutes,
-                    actual_minutes,
-                    fee_amount,
-                ),
+        try:
+            self._write(
+                [
+                    self._session_insert(
+                        user_id,
+                        user_name,
+                        guild_id,
+                        today,
+                        start_ts,
+                        end_ts,
+                        expected_minutes,
+                        actual_minutes,
+                        fee_amount,
+                    )
+                ]
             )
-
-            conn.commit()
-            conn.close()
+            self.report_cache.invalidate(guild_id, today)
             self.logger.info(
                 f"Recorded away session for {user_name} in guild {guild_id}: {actual_minutes} minutes"
             )
@@ -400,87 +518,415 @@ class DatabaseManager:
             traceback.print_exc()
             self.logger.error(f"Error recording away session: {e}")
 
-    def _fetch_away_data(self, date, guild_id, user_id=None):
-        """Fetch away data from the database for a specific guild."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def close_away_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        """
+        Close a user's active away session in a single transaction.
 
-        # If user_id is provided, fetch data for a specific user, else for all users (admin view)
-        if user_id:
-            cursor.execute(
-                """
-                SELECT user_name, total_minutes, over_limit_minutes, fee_amount
-                FROM away_daily
-                WHERE user_id = ? AND date = ? AND guild_id = ?
-                """,
-                (user_id, date, guild_id),
+        Records the session, adds it to today's totals and removes the active
+        session together, so a crash can never leave half of them written.
+        start_ts and end_ts are epoch seconds.
+
+        Returns:
+            tuple: (over_limit_minutes, fee_amount) for the user's day.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        try:
+            totals = self._get_daily_totals(user_id, guild_id, today)
+
+            self._write(
+                [
+                    self._session_insert(
+                        user_id,
+                        user_name,
+                        guild_id,
+                        today,
+                        start_ts,
+                        end_ts,
+                        expected_minutes,
+                        actual_minutes,
+                        fee_amount,
+                    ),
+                    # Before the daily upsert, they read the day's old totals
+                    *period_upserts(
+                        user_id,
+                        user_name,
+                        guild_id,
+                        today,
+                        actual_minutes,
+                        fee_amount,
+                        max_daily_minutes,
+                    ),
+                    self._daily_upsert(
+                        user_id,
+                        user_name,
+                        guild_id,
+                        today,
+                        actual_minutes,
+                        max_daily_minutes,
+                        fee_percentage,
+                    ),
+                    (DELETE_ACTIVE_SQL, (user_id, guild_id)),
+                ]
+            )
+            self.active_sessions.remove(guild_id, user_id)
+            self.report_cache.invalidate(guild_id, today)
+            over_limit, daily_fee = self._add_daily_minutes(
+                user_id,
+                guild_id,
+                today,
+                totals,
+                actual_minutes,
+                max_daily_minutes,
+                fee_percentage,
             )
-            user_record = cursor.fetchone()
 
-            cursor.execute(
-                """
-                SELECT start_time, end_time, expected_minutes, actual_minutes, fee_amount
-                FROM away_time
-                WHERE user_id = ? AND date = ? AND guild_id = ?
-                ORDER BY start_time
-                """,
-                (user_id, date, guild_id),
+            self.logger.info(
+                f"Closed away session for {user_name} in guild {guild_id}: {actual_minutes} minutes"
             )
-            session_records = cursor.fetchall()
+            return over_limit, daily_fee
+        except Exception as e:
+            traceback.print_exc()
+            self.logger.error(f"Error closing away session: {e}")
+            # Nothing was written, let the caller report the failure
+            raise
 
-            # Calculate accumulated fee from session records
-            accumulated_fee = sum(
-                record[4] for record in session_records
-            )  # record[4] is fee_amount
+    def _session_insert(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        date,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+    ):
+        # The text columns are kept for the reports, the *_ts ones for queries
+        return (
+            INSERT_SESSION_SQL,
+            (
+                user_id,
+                user_name,
+                guild_id,
+                date,
+                clock_time(start_ts),
+                clock_time(end_ts),
+                start_ts,
+                end_ts,
+                expected_minutes,
+                actual_minutes,
+                fee_amount,
+            ),
+        )
 
-            # Add accumulated fee to the user's daily record
-            user_record = (*user_record[:3], accumulated_fee)
+    def _daily_upsert(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        date,
+        minutes,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        return (
+            UPSERT_DAILY_SQL,
+            {
+                "user_id": user_id,
+                "user_name": user_name,
+                "guild_id": guild_id,
+                "date": date,
+                "minutes": minutes,
+                "max_daily": max_daily_minutes,
+                "fee_percentage": fee_percentage,
+            },
+        )
 
-            return user_record, session_records
-        else:
-            cursor.execute(
-                """
-                SELECT user_name, total_minutes, over_limit_minutes, fee_amount
-                FROM away_daily
-                WHERE date = ? AND guild_id = ?
-                ORDER BY total_minutes DESC
-                """,
-                (date, guild_id),
-            )
-            daily_records = cursor.fetchall()
+    def _write(self, statements):
+        """Commit a group of (sql, params) statements in one transaction,
+        or queue them for the next batch when write-behind is enabled"""
+        if self.write_queue is not None:
+            self.write_queue.enqueue(statements)
+            return
 
-            cursor.execute(
-                """
-                SELECT user_name, start_time, end_time, expected_minutes, actual_minutes, fee_amount
+        with self.get_connection() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.commit()
+
+    def _sync_pending_writes(self):
+        """Make queued writes visible before reading from the database"""
+        if self.write_queue is not None:
+            # Also waits for a batch the flush thread is committing right now
+            self.write_queue.flush()
+
+    def _fetch_away_data(self, date, guild_id, user_id=None):
+        """Fetch away data from the database for a specific guild.
+
+        Days that were moved out by archive_old_data() are read from the
+        month's archive file instead. Past days are served from the report
+        cache after the first read.
+        """
+        if date >= datetime.now().strftime("%Y-%m-%d"):
+            return self._query_away_data(date, guild_id, user_id)
+
+        records = self.report_cache.get(guild_id, date, user_id)
+        if records is not None:
+            return records
+
+        generation = self.report_cache.generation(guild_id, date)
+        records = self._query_away_data(date, guild_id, user_id)
+        self.report_cache.put(guild_id, date, user_id, records, generation)
+        return records
+
+    def _query_away_data(self, date, guild_id, user_id=None):
+        self._sync_pending_writes()
+        with self.report_pool.connection() as conn:
+            # One read transaction, so the daily rows and the sessions come
+            # from the same WAL snapshot even while sessions are being closed
+            conn.execute("BEGIN")
+            records = self._read_away_data(conn, date, guild_id, user_id)
+            conn.rollback()
+
+        if not records[0]:
+            archived = self.archive.read(self._read_away_data, date, guild_id, user_id)
+            if archived:
+                return archived
+        return records
+
+    def archive_old_data(self):
+        """Move history older than ARCHIVE_AFTER_DAYS into per-month archive files"""
+        self._sync_pending_writes()
+        return self.archive.archive_old_rows()
+
+    def prune_old_sessions(self):
+        """Roll sessions older than RETENTION_DAYS into away_time_rollup and prune them"""
+        self._sync_pending_writes()
+        pruned = self.retention.run()
+        if pruned:
+            # Pruned days now report without their individual sessions
+            self.report_cache.clear()
+        return pruned
+
+    def _read_away_data(self, conn, date, guild_id, user_id=None):
+        summary, sessions = self._away_data_cursors(conn, date, guild_id, user_id)
+        if user_id:
+            if not summary:
+                return None, []
+            return summary, sessions.fetchall()
+        return summary.fetchall(), sessions.fetchall()
+
+    def _away_data_cursors(self, conn, date, guild_id, user_id=None):
+        """Open the report queries for a day without fetching them.
+
+        Returns (summary, sessions). For a user, summary is their
+        (user_name, total_minutes, over_limit_minutes, fee) row or None and
+        sessions is None when there is no row. For the admin view, summary
+        is a cursor over those rows for every user.
+        """
+        # Sessions pruned by retention only survive as rollup rows, which
+        # archive files written before the rollup table existed don't have
+        rollup_fee, rollup_join = "0", ""
+        if self._has_rollup_table(conn):
+            rollup_fee = "COALESCE(r.fee_amount, 0)"
+            rollup_join = """
+                LEFT JOIN away_time_rollup r
+                    ON r.user_id = d.user_id AND r.date = d.date
+                    AND r.guild_id = d.guild_id
+            """
+
+        # If user_id is provided, fetch data for a specific user, else for all users (admin view)
+        user_filter = daily_filter = ""
+        params = (date, guild_id)
+        if user_id:
+            user_filter, daily_filter = " AND user_id = ?", " AND d.user_id = ?"
+            params = (date, guild_id, user_id)
+
+        # Accumulated fees are summed per user_id in SQL, so users who share
+        # a display name keep separate totals
+        summary = conn.execute(
+            f"""
+            SELECT d.user_name, d.total_minutes, d.over_limit_minutes,
+                   COALESCE(s.fee_amount, 0.0) + {rollup_fee}
+            FROM away_daily d
+            LEFT JOIN (
+                SELECT user_id, SUM(fee_amount) AS fee_amount
                 FROM away_time
-                WHERE date = ? AND guild_id = ?
-                ORDER BY start_time
-                """,
-                (date, guild_id),
-            )
-            session_records = cursor.fetchall()
+                WHERE date = ? AND guild_id = ?{user_filter}
+                GROUP BY user_id
+            ) s ON s.user_id = d.user_id
+            {rollup_join}
+            WHERE d.date = ? AND d.guild_id = ?{daily_filter}
+            ORDER BY d.total_minutes DESC
+            """,
+            params * 2,
+        )
 
-            # Create a dictionary to accumulate fees for each user
-            fee_totals = {}
+        if user_id:
+            summary = summary.fetchone()
+            if not summary:
+                return None, None
+            session_columns = "start_time, end_time"
+        else:
+            session_columns = "user_name, start_time, end_time"
+
+        sessions = conn.execute(
+            f"""
+            SELECT {session_columns}, expected_minutes, actual_minutes, fee_amount
+            FROM away_time
+            WHERE date = ? AND guild_id = ?{user_filter}
+            ORDER BY start_ts
+            """,
+            params,
+        )
+        return summary, sessions
 
-            for session in session_records:
-                user_name = session[0]  # record[0] is user_name
-                fee_amount = session[5]  # record[5] is fee_amount
+    @contextmanager
+    def stream_away_data(self, date, guild_id, user_id=None):
+        """Chunked form of _fetch_away_data for very large reports.
 
-                if user_name not in fee_totals:
-                    fee_totals[user_name] = 0.0
-                fee_totals[user_name] += fee_amount
+        Days with up to REPORT_STREAM_THRESHOLD sessions are served by
+        _fetch_away_data and its cache. Bigger days are read straight off
+        the cursors, REPORT_STREAM_CHUNK_SIZE rows per fetchmany(), inside
+        one read transaction. Everything must be consumed before the
+        ``with`` block ends.
+        """
+        self._sync_pending_writes()
+        with ExitStack() as stack:
+            conn = stack.enter_context(self.report_pool.connection())
+            conn.execute("BEGIN")  # Rolled back when the connection is returned
+
+            if not self._has_day(conn, date, guild_id, user_id):
+                archived = stack.enter_context(self.archive.connect(date))
+                if archived is not None:
+                    conn = archived
+
+            count = self._count_sessions(conn, date, guild_id, user_id)
+            if count > Config.REPORT_STREAM_THRESHOLD:
+                chunk_size = Config.REPORT_STREAM_CHUNK_SIZE
+                summary, sessions = self._away_data_cursors(
+                    conn, date, guild_id, user_id
+                )
+                if not user_id:
+                    summary = iter_rows(summary, chunk_size)
+                yield summary, count, iter_rows(sessions, chunk_size)
+                return
+
+        # Small day: the connection is back in the pool before this reads
+        summary, sessions = self._fetch_away_data(date, guild_id, user_id)
+        yield summary, len(sessions), iter(sessions)
+
+    def _has_day(self, conn, date, guild_id, user_id=None):
+        query = "SELECT 1 FROM away_daily WHERE date = ? AND guild_id = ?"
+        params = [date, guild_id]
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        return conn.execute(query + " LIMIT 1", params).fetchone() is not None
 
-            # Update the daily records with accumulated fee amounts
-            updated_daily_records = []
+    def _count_sessions(self, conn, date, guild_id, user_id=None):
+        query = "SELECT COUNT(*) FROM away_time WHERE date = ? AND guild_id = ?"
+        params = [date, guild_id]
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        return conn.execute(query, params).fetchone()[0]
+
+    def _has_rollup_table(self, conn):
+        return (
+            conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'away_time_rollup'"
+            ).fetchone()
+            is not None
+        )
 
-            for record in daily_records:
-                user_name = record[0]
-                accumulated_fee = fee_totals.get(user_name, 0.0)
-                updated_daily_record = (*record[:3], accumulated_fee)
-                updated_daily_records.append(updated_daily_record)
+    def get_sessions_between(self, guild_id, start_ts, end_ts, user_id=None):
+        """
+        Get closed away sessions that started in [start_ts, end_ts).
 
-            return updated_daily_records, session_records
+        Args:
+            guild_id (int): The ID of the guild.
+            start_ts (int): Window start, epoch seconds (inclusive).
+            end_ts (int): Window end, epoch seconds (exclusive).
+            user_id (int, optional): Only return this user's sessions.
+
+        Returns:
+            list: (user_id, user_name, start_ts, end_ts, expected_minutes,
+            actual_minutes, fee_amount) tuples ordered by start_ts.
+        """
+        query = """
+            SELECT user_id, user_name, start_ts, end_ts, expected_minutes, actual_minutes, fee_amount
+            FROM away_time
+            WHERE guild_id = ? AND start_ts >= ? AND start_ts < ?
+        """
+        params = [guild_id, start_ts, end_ts]
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY start_ts"
+
+        self._sync_pending_writes()
+        with self.report_pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def get_period_totals(self, guild_id, period_type, period, user_id=None):
+        """
+        Get weekly or monthly totals from the aggregate tables.
+
+        Args:
+            guild_id (int): The ID of the guild.
+            period_type (str): "week" or "month".
+            period (str): "YYYY-Www" for weeks, "YYYY-MM" for months.
+            user_id (int, optional): Only return this user's row.
+
+        Returns:
+            list: (user_id, user_name, session_count, total_minutes,
+            over_limit_minutes, late_count, fee_amount) tuples ordered by
+            total_minutes descending.
+        """
+        query = f"""
+            SELECT user_id, user_name, session_count, total_minutes,
+                   over_limit_minutes, late_count, fee_amount
+            FROM {PERIOD_TABLES[period_type]}
+            WHERE guild_id = ? AND period = ?
+        """
+        params = [guild_id, period]
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY total_minutes DESC"
+
+        self._sync_pending_writes()
+        with self.report_pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def rebuild_period_totals(self, guild_id=None):
+        """Recompute the weekly and monthly totals from history; returns rows written"""
+        self._sync_pending_writes()
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                written = rebuild_period_totals(conn, guild_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self.logger.info(f"Rebuilt {written} weekly and monthly total rows")
+        return written
 
     def add_active_away_session(self, user_id, user_name, guild_id, expected_minutes):
         """
@@ -490,30 +936,36 @@ class DatabaseManager:
             user_id (int): The ID of the user.
             user_name (str): The name of the user.
             guild_id (int): The ID of the guild.
-            start_time (str): The start time of the away session.
             expected_minutes (int): The expected duration of the away session in minutes.
         """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            now = datetime.now()
-            start_time = now.strftime("%H:%M:%S")
+            start_ts = int(datetime.now().timestamp())
 
-            cursor.execute(
-                """
-                INSERT INTO active_away_sessions
-                (user_id, user_name, guild_id, start_time, expected_minutes)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(user_id, guild_id) DO UPDATE SET
-                    start_time = excluded.start_time,
-                    expected_minutes = excluded.expected_minutes
-                """,
-                (user_id, user_name, guild_id, start_time, expected_minutes),
+            self._write(
+                [
+                    (
+                        UPSERT_ACTIVE_SQL,
+                        (
+                            user_id,
+                            user_name,
+                            guild_id,
+                            clock_time(start_ts),
+                            start_ts,
+                            expected_minutes,
+                        ),
+                    )
+                ]
+            )
+            self.active_sessions.put(
+                {
+                    "user_id": user_id,
+                    "user_name": user_name,
+                    "guild_id": guild_id,
+                    "start_time": datetime.fromtimestamp(start_ts).time(),
+                    "start_ts": start_ts,
+                    "expected_minutes": expected_minutes,
+                }
             )
-
-            conn.commit()
-            conn.close()
             self.logger.info(
                 f"Active away session added for user {user_name} (ID: {user_id}) in guild {guild_id}"
             )
@@ -530,19 +982,8 @@ class DatabaseManager:
             guild_id (int): The ID of the guild.
         """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                DELETE FROM active_away_sessions
-                WHERE user_id = ? AND guild_id = ?
-                """,
-                (user_id, guild_id),
-            )
-
-            conn.commit()
-            conn.close()
+            self._write([(DELETE_ACTIVE_SQL, (user_id, guild_id))])
+            self.active_sessions.remove(guild_id, user_id)
             self.logger.info(
                 f"Active away session removed for user {user_id} in guild {guild_id}"
             )
@@ -554,36 +995,22 @@ class DatabaseManager:
         """
         Get an active away session for a user in a specific guild.
 
+        Served from the in-memory index, which mirrors active_away_sessions.
+
         Args:
             user_id (int): The ID of the user.
             guild_id (int): The ID of the guild.
 
         Returns:
-            dict: The active away session, or None if not found.
+            dict: The active away session, or None if not found. ``start_ts``
+            is the epoch start, ``start_time`` the local time of day.
         """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                SELECT * FROM active_away_sessions
-                WHERE user_id = ? AND guild_id = ?
-                """,
-                (user_id, guild_id),
-            )
-
-            result = cursor.fetchone()
-            conn.close()
-
-            if result:
-                columns = [description[0] for description in cursor.description]
-                session = dict(zip(columns, result))
-                session["start_time"] = datetime.strptime(
-                    session["start_time"], "%H:%M:%S"
-                ).time()
-                return session
-            return None
+            if not self.active_sessions.loaded:
+                self._sync_pending_writes()
+                with self.get_connection() as conn:
+                    self._load_active_sessions(conn)
+            return self.active_sessions.get(guild_id, user_id)
         except Exception as e:
             traceback.print_exc()
             self.logger.error(f"Error fetching active away session: {e}")
@@ -0,0 +1,100 @@
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No pooled connection came free within the pool's timeout"""
+
+
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections.
+
+    PRAGMAs are applied once when a connection is opened, so checking a
+    connection out afterwards only costs a queue operation.
+    """
+
+    def __init__(self, db_path, size=5, pragmas=None, timeout=30, uri=False):
+        self.db_path = db_path
+        self.size = size
+        self.uri = uri
+        self.timeout = timeout
+        self.pragmas = pragmas or {}
+        self.logger = logging.getLogger("discord_bot")
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _open(self):
+        # Connections are handed between threads, so sqlite3's same-thread
+        # check is disabled; the pool guarantees one user at a time.
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            uri=self.uri,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+
+        if can_open:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        # Pool is exhausted, wait for another caller to give one back
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(
+                f"No connection to {self.db_path} came free within "
+                f"{self.timeout}s, all {self.size} are in use"
+            ) from None
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            # Never hand out a connection holding an open write transaction
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a ``with`` block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Close every idle connection; busy ones are closed when returned"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        self.logger.info(f"Connection pool for {self.db_path} closed")
@@ -0,0 +1,305 @@
+import logging
+import threading
+from datetime import datetime
+from config import Config
+from utils.aggregates import PERIOD_KEYS
+from utils.settings import ServerSettings
+from utils.storage import SETTINGS_COLUMNS, StorageBackend, clock_time
+
+# Column defaults of the server_settings table, for rows created by an update
+TABLE_DEFAULTS = {
+    "command_prefix": "!",
+    "channel_id": None,
+    "grace_period_minutes": 1,
+    "fee_percentage_per_minute": 0.0007,
+    "max_single_away_minutes": 40,
+    "max_daily_away_minutes": 90,
+    "work_start_hour": 9,
+    "work_end_hour": 17,
+    "return_phrases": None,
+    "tracked_channels": None,
+}
+
+
+class MemoryStorage(StorageBackend):
+    """Storage backend that keeps everything in dictionaries.
+
+    Nothing survives a restart. It exists for fast test runs and as a
+    baseline when measuring what the SQLite backend costs the cogs. One lock
+    guards all the state, so it is safe behind AsyncDatabaseManager.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("discord_bot")
+        self._lock = threading.Lock()
+        self._settings = {}  # guild_id -> server_settings row dict
+        self._sessions = {}  # (guild_id, date) -> [session tuple, ...]
+        self._daily = {}  # (guild_id, date, user_id) -> [user_name, total, over, fee]
+        self._active = {}  # (guild_id, user_id) -> session dict
+
+    def initialize(self):
+        self.logger.info("Using in-memory storage, nothing will be persisted")
+
+    def close(self):
+        pass
+
+    def save_guild_config(self, guild_id, config_data):
+        row = {
+            "command_prefix": config_data.get("command_prefix", Config.PREFIX),
+            "channel_id": config_data.get("channel_id", Config.CHANNEL_ID),
+            "grace_period_minutes": config_data.get(
+                "grace_period_minutes", Config.GRACE_PERIOD_MINUTES
+            ),
+            "fee_percentage_per_minute": config_data.get(
+                "fee_percentage_per_minute", Config.FEE_PERCENTAGE_PER_MINUTE
+            ),
+            "max_single_away_minutes": config_data.get(
+                "max_single_away_minutes", Config.MAX_SINGLE_AWAY_MINUTES
+            ),
+            "max_daily_away_minutes": config_data.get(
+                "max_daily_away_minutes", Config.MAX_DAILY_AWAY_MINUTES
+            ),
+            "work_start_hour": config_data.get("work_start_hour", 9),
+            "work_end_hour": config_data.get("work_end_hour", 17),
+            "return_phrases": config_data.get("return_phrases"),
+            "tracked_channels": config_data.get("tracked_channels"),
+        }
+        with self._lock:
+            self._settings[guild_id] = row
+
+    def get_server_settings(self, guild_id):
+        row = self._settings.get(guild_id)
+        return ServerSettings.from_row(guild_id, row and dict(row))
+
+    def get_server_setting(self, guild_id, setting_name):
+        row = self._settings.get(guild_id)
+        if row is None:
+            return Config.__dict__.get(setting_name.upper())
+        if setting_name not in row:
+            self.logger.error(
+                f"Error while fetching server setting '{setting_name}': no such column"
+            )
+            return None
+        return row[setting_name]
+
+    def update_server_settings(self, guild_id, settings):
+        unknown = set(settings) - set(SETTINGS_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown server settings: {', '.join(sorted(unknown))}")
+
+        with self._lock:
+            row = self._settings.setdefault(guild_id, dict(TABLE_DEFAULTS))
+            row.update(settings)
+        return True
+
+    def get_today_away_time(self, user_id, guild_id):
+        today = datetime.now().strftime("%Y-%m-%d")
+        daily = self._daily.get((guild_id, today, user_id))
+        return daily[1] if daily else 0
+
+    def _add_daily_minutes(
+        self, user_id, user_name, guild_id, today, minutes, max_daily, fee_percentage
+    ):
+        # Same arithmetic as UPSERT_DAILY_SQL; the caller holds the lock
+        daily = self._daily.setdefault((guild_id, today, user_id), [user_name, 0, 0, 0])
+        daily[1] += minutes
+        daily[2] = max(0, daily[1] - max_daily)
+        daily[3] = daily[2] * fee_percentage
+        return daily[2], daily[3]
+
+    def _add_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        today,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+    ):
+        self._sessions.setdefault((guild_id, today), []).append(
+            (
+                user_id,
+                user_name,
+                start_ts,
+                end_ts,
+                expected_minutes,
+                actual_minutes,
+                fee_amount,
+            )
+        )
+
+    def update_daily_totals(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        minutes_away,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            return self._add_daily_minutes(
+                user_id,
+                user_name,
+                guild_id,
+                today,
+                minutes_away,
+                max_daily_minutes,
+                fee_percentage,
+            )
+
+    def record_away_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+    ):
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            self._add_session(
+                user_id,
+                user_name,
+                guild_id,
+                today,
+                start_ts,
+                end_ts,
+                expected_minutes,
+                actual_minutes,
+                fee_amount,
+            )
+
+    def close_away_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            self._add_session(
+                user_id,
+                user_name,
+                guild_id,
+                today,
+                start_ts,
+                end_ts,
+                expected_minutes,
+                actual_minutes,
+                fee_amount,
+            )
+            self._active.pop((guild_id, user_id), None)
+            return self._add_daily_minutes(
+                user_id,
+                user_name,
+                guild_id,
+                today,
+                actual_minutes,
+                max_daily_minutes,
+                fee_percentage,
+            )
+
+    def _fetch_away_data(self, date, guild_id, user_id=None):
+        with self._lock:
+            sessions = sorted(
+                self._sessions.get((guild_id, date), []), key=lambda s: s[2]
+            )
+            daily = [
+                (key[2], *values)
+                for key, values in self._daily.items()
+                if key[0] == guild_id and key[1] == date
+            ]
+
+        if user_id:
+            record = next((d for d in daily if d[0] == user_id), None)
+            if not record:
+                return None, []
+            session_records = [
+                (clock_time(s[2]), clock_time(s[3]), *s[4:])
+                for s in sessions
+                if s[0] == user_id
+            ]
+            accumulated_fee = sum(session[4] for session in session_records)
+            return (*record[1:4], accumulated_fee), session_records
+
+        session_records = [
+            (s[1], clock_time(s[2]), clock_time(s[3]), *s[4:]) for s in sessions
+        ]
+        fee_totals = {}  # Keyed by user_id, display names aren't unique
+        for session in sessions:
+            fee_totals[session[0]] = fee_totals.get(session[0], 0.0) + session[6]
+
+        daily.sort(key=lambda d: d[2], reverse=True)
+        daily_records = [(*d[1:4], fee_totals.get(d[0], 0.0)) for d in daily]
+        return daily_records, session_records
+
+    def get_sessions_between(self, guild_id, start_ts, end_ts, user_id=None):
+        with self._lock:
+            sessions = [
+                session
+                for (guild, _), day in self._sessions.items()
+                if guild == guild_id
+                for session in day
+                if start_ts <= session[2] < end_ts
+                and (not user_id or session[0] == user_id)
+            ]
+        return sorted(sessions, key=lambda s: s[2])
+
+    def get_period_totals(self, guild_id, period_type, period, user_id=None):
+        period_of = PERIOD_KEYS[period_type]
+        totals = {}  # user_id -> [user_name, sessions, minutes, over, late, fee]
+        with self._lock:
+            for (guild, date), day in self._sessions.items():
+                if guild != guild_id or period_of(date) != period:
+                    continue
+                for session in day:
+                    row = totals.setdefault(session[0], [session[1], 0, 0, 0, 0, 0])
+                    row[1] += 1
+                    row[2] += session[5]
+                    row[4] += session[6] > 0
+                    row[5] += session[6]
+            for (guild, date, user), daily in self._daily.items():
+                if guild == guild_id and period_of(date) == period and user in totals:
+                    totals[user][3] += daily[2]
+
+        rows = [
+            (user, *row)
+            for user, row in totals.items()
+            if not user_id or user == user_id
+        ]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def add_active_away_session(self, user_id, user_name, guild_id, expected_minutes):
+        start_ts = int(datetime.now().timestamp())
+        with self._lock:
+            self._active[(guild_id, user_id)] = {
+                "user_id": user_id,
+                "user_name": user_name,
+                "guild_id": guild_id,
+                "start_time": datetime.fromtimestamp(start_ts).time(),
+                "start_ts": start_ts,
+                "expected_minutes": expected_minutes,
+            }
+
+    def remove_active_away_session(self, user_id, guild_id):
+        with self._lock:
+            self._active.pop((guild_id, user_id), None)
+
+    def get_active_away_session(self, user_id, guild_id):
+        session = self._active.get((guild_id, user_id))
+        return dict(session) if session else None
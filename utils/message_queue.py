@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import traceback
+
+SHED_POLICIES = ("newest", "oldest")
+
+
+class MessagePipeline:
+    """Bounded queue of classified messages served by a pool of workers.
+
+    ``submit()`` never waits, so the gateway's on_message returns at once
+    however slow the handlers' storage and send calls are. Items are split
+    over one lane per worker by a key (the author id), so one user's "away"
+    and "back" are still handled in order. When a lane is full the item is
+    shed: "newest" drops the incoming one, "oldest" the longest-waiting one.
+    """
+
+    def __init__(self, handler, max_size=1000, workers=4, shed_policy="newest"):
+        if shed_policy not in SHED_POLICIES:
+            raise ValueError(f"Unknown shed policy: {shed_policy}")
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.shed_policy = shed_policy
+        self.logger = logging.getLogger("discord_bot")
+        lane_size = max(1, max_size // workers)
+        self._lanes = [asyncio.Queue(lane_size) for _ in range(workers)]
+        self._tasks = []
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.max_depth = 0
+        self._shedding = False
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._work(lane), name=f"message-worker-{i}")
+            for i, lane in enumerate(self._lanes)
+        ]
+        self.logger.info(
+            f"Message pipeline started: {self.workers} workers, "
+            f"{self.max_size} queued at most, shedding {self.shed_policy}"
+        )
+
+    def depth(self):
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def submit(self, key, *args):
+        """Queue ``handler(*args)``; returns False if it was shed instead"""
+        self.submitted += 1
+        lane = self._lanes[hash(key) % self.workers]
+        if lane.full():
+            self._shed()
+            if self.shed_policy == "newest":
+                return False
+            lane.get_nowait()
+            lane.task_done()
+        lane.put_nowait(args)
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    def _shed(self):
+        self.shed += 1
+        if not self._shedding:
+            self._shedding = True
+            self.logger.warning(
+                f"Message queue full ({self.depth()} waiting), "
+                f"shedding {self.shed_policy} messages"
+            )
+
+    async def _work(self, lane):
+        while True:
+            args = await lane.get()
+            try:
+                await self.handler(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                traceback.print_exc()
+                self.logger.error(f"Error in message worker: {e}")
+            finally:
+                lane.task_done()
+
+            if self._shedding and self.depth() == 0:
+                self._shedding = False
+                self.logger.info(
+                    f"Message queue drained, {self.shed} messages shed so far"
+                )
+
+    async def close(self, timeout=10):
+        """Give queued messages ``timeout`` seconds to finish, then stop"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(lane.join() for lane in self._lanes)), timeout
+            )
+        except asyncio.TimeoutError:
+            self.logger.warning(
+                f"Stopping message workers with {self.depth()} messages queued"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "capacity": sum(lane.maxsize for lane in self._lanes),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shed": self.shed,
+        }
@@ -0,0 +1,159 @@
+import logging
+from utils.aggregates import rebuild_period_totals
+
+logger = logging.getLogger("discord_bot")
+
+
+# Ordered schema migrations applied on startup after the base tables exist.
+# Each entry is (version, description, steps); a step is either a SQL string
+# or a callable taking the connection. The applied version is stored in
+# PRAGMA user_version, so every migration runs exactly once per database.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    (
+        1,
+        "Index away_time and away_daily for per-guild, per-day lookups",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS idx_away_time_guild_date_user
+            ON away_time (guild_id, date, user_id)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_away_daily_guild_date
+            ON away_daily (guild_id, date, total_minutes)
+            """,
+        ],
+    ),
+    (
+        2,
+        "Store session times as epoch seconds and index them by guild",
+        [
+            "ALTER TABLE away_time ADD COLUMN start_ts INTEGER",
+            "ALTER TABLE away_time ADD COLUMN end_ts INTEGER",
+            "ALTER TABLE active_away_sessions ADD COLUMN start_ts INTEGER",
+            # Old rows hold local wall-clock text, the 'utc' modifier converts
+            # it to UTC. date is the day the session closed, so a session
+            # ending "before" it started began the day before.
+            """
+            UPDATE away_time SET
+                start_ts = CAST(strftime('%s', date || ' ' || start_time, 'utc') AS INTEGER)
+                    - CASE WHEN end_time < start_time THEN 86400 ELSE 0 END,
+                end_ts = CAST(strftime('%s', date || ' ' || end_time, 'utc') AS INTEGER)
+            WHERE start_ts IS NULL
+            """,
+            # Active sessions only kept a time of day, assume the latest one
+            """
+            UPDATE active_away_sessions SET
+                start_ts = CAST(strftime('%s', date('now', 'localtime') || ' ' || start_time, 'utc') AS INTEGER)
+                    - CASE WHEN start_time > time('now', 'localtime') THEN 86400 ELSE 0 END
+            WHERE start_ts IS NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_away_time_guild_start
+            ON away_time (guild_id, start_ts)
+            """,
+        ],
+    ),
+    (
+        3,
+        "Add away_time_rollup for sessions pruned by the retention engine",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS away_time_rollup (
+                guild_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                session_count INTEGER DEFAULT 0,
+                expected_minutes INTEGER DEFAULT 0,
+                actual_minutes INTEGER DEFAULT 0,
+                late_count INTEGER DEFAULT 0,
+                fee_amount REAL DEFAULT 0,
+                PRIMARY KEY (guild_id, date, user_id)
+            )
+            """,
+        ],
+    ),
+    (
+        4,
+        "Add weekly and monthly totals and backfill them from history",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS away_weekly (
+                guild_id INTEGER NOT NULL,
+                period TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                session_count INTEGER DEFAULT 0,
+                total_minutes INTEGER DEFAULT 0,
+                over_limit_minutes INTEGER DEFAULT 0,
+                late_count INTEGER DEFAULT 0,
+                fee_amount REAL DEFAULT 0,
+                PRIMARY KEY (guild_id, period, user_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS away_monthly (
+                guild_id INTEGER NOT NULL,
+                period TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                user_name TEXT NOT NULL,
+                session_count INTEGER DEFAULT 0,
+                total_minutes INTEGER DEFAULT 0,
+                over_limit_minutes INTEGER DEFAULT 0,
+                late_count INTEGER DEFAULT 0,
+                fee_amount REAL DEFAULT 0,
+                PRIMARY KEY (guild_id, period, user_id)
+            )
+            """,
+            rebuild_period_totals,
+        ],
+    ),
+    (
+        5,
+        "Add per-guild return phrases to server_settings",
+        [
+            "ALTER TABLE server_settings ADD COLUMN return_phrases TEXT",
+        ],
+    ),
+    (
+        6,
+        "Add per-guild tracked channels to server_settings",
+        [
+            "ALTER TABLE server_settings ADD COLUMN tracked_channels TEXT",
+        ],
+    ),
+]
+
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database file"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """Apply every pending migration, each in its own transaction"""
+    version = get_schema_version(conn)
+
+    for target, description, steps in MIGRATIONS:
+        if target <= version:
+            continue
+
+        logger.info(f"Applying schema migration {target}: {description}")
+        try:
+            # Explicit BEGIN so DDL and the version bump commit together
+            conn.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Schema migration {target} failed, rolled back")
+            raise
+        version = target
+
+    return version
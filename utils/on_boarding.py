@@ -1,6 +1,7 @@
 from discord.ext import commands
 from cogs.embed import EmbedHandler
-from utils.db_manager import DatabaseManager
+from utils.async_db import AsyncDatabaseManager
+from utils.storage import create_storage
 import discord
 from discord.ui import Button, View
 import traceback
@@ -12,9 +13,9 @@ logger = logging.getLogger("bot.onboarding")
 
 
 class OnBoarding(commands.Cog):
-    def __init__(self, bot, my_commands):
+    def __init__(self, bot, my_commands, db=None):
         self.bot = bot
-        self.db = DatabaseManager()
+        self.db = db or AsyncDatabaseManager(create_storage())
         logger.info("OnBoarding cog initialized")
         self.commands = my_commands
 
@@ -25,7 +26,7 @@ class OnBoarding(commands.Cog):
             logger.info(f"Bot joined guild: {guild.name} (ID: {guild.id})")
 
             # Save default configuration settings for the new guild
-            self.db.save_guild_config(guild.id, {})
+            await self.db.save_guild_config(guild.id, {})
             logger.info(
                 f"Default configuration saved for guild: {guild.name} (ID: {guild.id})"
             )
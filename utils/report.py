@@ -1,3 +1,5 @@
+import os
+import tempfile
 from fpdf import FPDF
 
 
@@ -19,13 +21,21 @@ class ReportGenerator(FPDF):
         user_record=None,
         session_records=None,
         is_admin=False,
+        session_count=None,
     ):
+        """Render a report as text, or as a PDF for more than 15 sessions.
+
+        The records may be iterators, as from stream_away_data(), as long as
+        session_count is given; they are then only read once, row by row.
+        """
         is_pdf = False
-        if len(session_records) <= 15:
+        if session_count is None:
+            session_count = len(session_records)
+        if session_count <= 15:
             report = self.generate_txt_report(
                 date=date,
                 daily_records=daily_records,
-                session_records=session_records,
+                session_records=list(session_records),
                 user_record=user_record,
                 is_admin=is_admin,
             )
@@ -48,8 +58,14 @@ class ReportGenerator(FPDF):
         user_record=None,
         session_records=None,
         is_admin=False,
-        output_filename="report.pdf",
+        output_filename=None,
     ):
+        """Render a PDF report; returns its path.
+
+        Without ``output_filename`` it goes to a new temporary file, so
+        reports rendered at the same time never share a file. The caller
+        deletes it once sent.
+        """
         self.add_page()
         self.set_auto_page_break(auto=True, margin=15)
 
@@ -66,7 +82,16 @@ class ReportGenerator(FPDF):
         else:
             self.generate_user_report(user_record, session_records)
 
-        self.output(output_filename)
+        if output_filename is None:
+            fd, output_filename = tempfile.mkstemp(
+                prefix=f"away_report_{date}_", suffix=".pdf"
+            )
+            os.close(fd)
+        try:
+            self.output(output_filename)
+        except Exception:
+            os.remove(output_filename)
+            raise
         return output_filename
 
     def generate_admin_report(self, daily_records, session_records):
@@ -0,0 +1,177 @@
+"""Roll-up and pruning of expired away sessions.
+
+The Maintenance cog runs this daily when RETENTION_DAYS is set. Databases
+created before incremental auto_vacuum need a one-off conversion before
+freed pages can be returned to the filesystem. It rewrites the whole file
+and locks it for the duration, so stop the bot first:
+
+    python -m utils.retention --convert-vacuum [--db loyalty_bot.db]
+"""
+
+import time
+import logging
+import argparse
+from config import Config
+
+
+class RetentionManager:
+    """Rolls old away_time rows into daily summaries and prunes them.
+
+    Sessions older than ``retention_days`` are folded into
+    ``away_time_rollup`` (one row per guild, day and user) and deleted in
+    batches of ``batch_size``. Each batch is its own short transaction, so
+    away/return writes can get in between. Freed pages are then returned to
+    the filesystem with ``PRAGMA incremental_vacuum``, a few at a time.
+    """
+
+    def __init__(self, pool, retention_days, batch_size=500, vacuum_pages=1000):
+        self.pool = pool
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.logger = logging.getLogger("discord_bot")
+
+    def cutoff_date(self):
+        cutoff = time.time() - self.retention_days * 86400
+        return time.strftime("%Y-%m-%d", time.localtime(cutoff))
+
+    def run(self):
+        """Roll up and prune expired sessions; returns the number of rows removed"""
+        if self.retention_days <= 0:
+            return 0
+
+        cutoff = self.cutoff_date()
+        pruned = 0
+        with self.pool.connection() as conn:
+            while True:
+                removed = self._prune_batch(conn, cutoff)
+                if not removed:
+                    break
+                pruned += removed
+                # Give queued writers a chance at the lock between batches
+                time.sleep(0.01)
+
+            reclaimed = 0
+            if self.incremental_vacuum_enabled(conn):
+                reclaimed = self._incremental_vacuum(conn)
+            else:
+                self.logger.warning(
+                    "Database is not in incremental auto_vacuum mode, freed pages "
+                    "are kept; run python -m utils.retention --convert-vacuum "
+                    "with the bot stopped"
+                )
+
+        if pruned:
+            self.logger.info(
+                f"Rolled up {pruned} sessions older than {cutoff}, reclaimed {reclaimed} pages"
+            )
+        return pruned
+
+    def _prune_batch(self, conn, cutoff):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Fix the batch by rowid so the rollup and the delete see the same rows
+            last_id = conn.execute(
+                """
+                SELECT MAX(id) FROM (
+                    SELECT id FROM away_time WHERE date < ? ORDER BY id LIMIT ?
+                )
+                """,
+                (cutoff, self.batch_size),
+            ).fetchone()[0]
+            if last_id is None:
+                conn.rollback()
+                return 0
+
+            conn.execute(
+                """
+                INSERT INTO away_time_rollup
+                (guild_id, date, user_id, user_name, session_count, expected_minutes,
+                 actual_minutes, late_count, fee_amount)
+                SELECT guild_id, date, user_id, MAX(user_name), COUNT(*),
+                       SUM(expected_minutes), SUM(actual_minutes),
+                       SUM(fee_amount > 0), SUM(fee_amount)
+                FROM away_time
+                WHERE date < ? AND id <= ?
+                GROUP BY guild_id, date, user_id
+                ON CONFLICT(guild_id, date, user_id) DO UPDATE SET
+                    session_count = session_count + excluded.session_count,
+                    expected_minutes = expected_minutes + excluded.expected_minutes,
+                    actual_minutes = actual_minutes + excluded.actual_minutes,
+                    late_count = late_count + excluded.late_count,
+                    fee_amount = fee_amount + excluded.fee_amount
+                """,
+                (cutoff, last_id),
+            )
+            removed = conn.execute(
+                "DELETE FROM away_time WHERE date < ? AND id <= ?", (cutoff, last_id)
+            ).rowcount
+            conn.commit()
+            return removed
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def incremental_vacuum_enabled(conn):
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def convert_to_incremental_vacuum(self):
+        """Switch an older database to incremental auto_vacuum.
+
+        New databases get it from the pool PRAGMAs; older files need one
+        full VACUUM, which locks the database for as long as it runs.
+        Returns False if the database was already converted.
+        """
+        with self.pool.connection() as conn:
+            if self.incremental_vacuum_enabled(conn):
+                return False
+            self.logger.info("Converting database to incremental auto_vacuum")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+
+    def _incremental_vacuum(self, conn):
+        reclaimed = 0
+        last_free = None
+        while True:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages or free_pages == last_free:
+                return reclaimed
+            last_free = free_pages
+            step = min(free_pages, self.vacuum_pages)
+            conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+            reclaimed += step
+            time.sleep(0.01)
+
+
+def main(argv=None):
+    from utils.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.retention",
+        description="Roll up and prune expired away sessions",
+    )
+    parser.add_argument("--db", default=Config.DB_PATH, help="database file")
+    parser.add_argument(
+        "--convert-vacuum",
+        action="store_true",
+        help="one-off switch to incremental auto_vacuum (full VACUUM)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger = logging.getLogger("discord_bot")
+
+    db = DatabaseManager(args.db, pool_size=1)
+    db.initialize()
+    try:
+        if args.convert_vacuum:
+            if not db.retention.convert_to_incremental_vacuum():
+                logger.info(f"{args.db} already uses incremental auto_vacuum")
+        db.prune_old_sessions()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
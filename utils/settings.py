@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field, fields
+from datetime import datetime, time
+from config import Config
+
+
+def parse_phrases(value):
+    """Split a comma-separated phrase setting into lowercase phrases"""
+    phrases = (phrase.strip().lower() for phrase in str(value or "").split(","))
+    return tuple(phrase for phrase in phrases if phrase)
+
+
+def parse_channel_ids(value):
+    """Split a comma-separated channel id setting into a frozenset of ints"""
+    ids = (part.strip() for part in str(value or "").split(","))
+    return frozenset(int(part) for part in ids if part.isdigit())
+
+
+def parse_work_time(value):
+    """Parse a stored work hour ("09:00", 9 or a time) into a datetime.time"""
+    if isinstance(value, time):
+        return value
+    if isinstance(value, int):
+        return time(value, 0)
+    return datetime.strptime(str(value), "%H:%M").time()
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    """Parsed, read-only settings for one guild.
+
+    Instances are shared through the settings cache, so they are frozen.
+    Dict-style access (``settings["channel_id"]``) is kept for the cogs and
+    embeds that were written against the old row dictionaries.
+    """
+
+    guild_id: int
+    command_prefix: str = Config.PREFIX
+    channel_id: int = Config.CHANNEL_ID
+    grace_period_minutes: int = Config.GRACE_PERIOD_MINUTES
+    fee_percentage_per_minute: float = Config.FEE_PERCENTAGE_PER_MINUTE
+    max_single_away_minutes: int = Config.MAX_SINGLE_AWAY_MINUTES
+    max_daily_away_minutes: int = Config.MAX_DAILY_AWAY_MINUTES
+    work_start_hour: object = Config.WORK_START_TIME
+    work_end_hour: object = Config.WORK_END_TIME
+    return_phrases: str = Config.RETURN_PHRASES
+    tracked_channels: str = None
+    # Parsed once here instead of on every is_work_hours() call
+    work_start: time = field(init=False, default=None)
+    work_end: time = field(init=False, default=None)
+    return_phrase_list: tuple = field(init=False, default=())
+    # Empty means every channel in the guild is tracked
+    tracked_channel_ids: frozenset = field(init=False, default=frozenset())
+
+    def __post_init__(self):
+        for raw, parsed in (
+            ("work_start_hour", "work_start"),
+            ("work_end_hour", "work_end"),
+        ):
+            try:
+                value = parse_work_time(getattr(self, raw))
+            except (TypeError, ValueError):
+                value = None  # is_work_hours() reports unparseable hours
+            object.__setattr__(self, parsed, value)
+        object.__setattr__(
+            self, "return_phrase_list", parse_phrases(self.return_phrases)
+        )
+        object.__setattr__(
+            self, "tracked_channel_ids", parse_channel_ids(self.tracked_channels)
+        )
+
+    @classmethod
+    def from_row(cls, guild_id, row=None):
+        """Build settings from a server_settings row dict, or defaults if None"""
+        if not row:
+            return cls(guild_id=guild_id)
+
+        names = {f.name for f in fields(cls) if f.init}
+        values = {k: v for k, v in row.items() if k in names and v is not None}
+        values["guild_id"] = guild_id
+        return cls(**values)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
@@ -0,0 +1,266 @@
+import os
+import glob
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import Config
+from utils.db_manager import DatabaseManager
+from utils.storage import StorageBackend
+
+
+class _Shard:
+    """An open (or opening) shard and the number of calls using it"""
+
+    __slots__ = ("manager", "users", "ready", "error")
+
+    def __init__(self):
+        self.manager = None
+        self.users = 0
+        self.ready = threading.Event()  # Set once the opener has finished
+        self.error = None
+
+
+class ShardedStorage(StorageBackend):
+    """SQLite storage split across several files by guild.
+
+    In "guild" mode every guild gets its own ``guild_<id>.db``; in "bucket"
+    mode guilds are hashed into ``bucket_<n>.db`` files. Each shard is a
+    full DatabaseManager with its own pool, caches and write lock, so a
+    busy guild no longer holds up writes for everyone else.
+
+    Shards are opened on first use and kept in an LRU of at most
+    ``max_open``. A shard is only closed once no call is using it, so the
+    LRU can run over its bound briefly while every open shard is busy.
+    Opening and closing happen outside the shared lock, so a shard running
+    its migrations never holds up calls for the others.
+    """
+
+    def __init__(
+        self,
+        mode,
+        shard_dir=None,
+        buckets=None,
+        max_open=None,
+        pool_size=None,
+    ):
+        if mode not in ("guild", "bucket"):
+            raise ValueError(f"Unknown shard mode: {mode}")
+        self.mode = mode
+        self.shard_dir = shard_dir or Config.DB_SHARD_DIR
+        self.buckets = buckets or Config.DB_SHARD_BUCKETS
+        self.max_open = max_open or Config.DB_SHARD_MAX_OPEN
+        self.pool_size = pool_size or Config.DB_SHARD_POOL_SIZE
+        self.max_workers = Config.DB_POOL_SIZE
+        self.report_workers = Config.DB_REPORT_POOL_SIZE
+        self.logger = logging.getLogger("discord_bot")
+        self._lock = threading.Lock()
+        # shard name -> _Shard, oldest first
+        self._open = OrderedDict()
+        # shard name -> Event set once its evicted manager has been closed
+        self._closing = {}
+
+    def shard_name(self, guild_id):
+        """File name (without .db) of the shard holding ``guild_id``"""
+        if self.mode == "guild":
+            return f"guild_{guild_id}"
+        # crc32 rather than hash() so the bucket is stable across restarts
+        bucket = zlib.crc32(str(guild_id).encode()) % self.buckets
+        return f"bucket_{bucket:03d}"
+
+    def _open_shard(self, name):
+        manager = DatabaseManager(
+            os.path.join(self.shard_dir, f"{name}.db"),
+            archive_dir=os.path.join(Config.ARCHIVE_DIR, name),
+            pool_size=self.pool_size,
+        )
+        manager.initialize()
+        return manager
+
+    @contextmanager
+    def _checkout(self, name):
+        entry = self._acquire(name)
+        try:
+            yield entry.manager
+        finally:
+            with self._lock:
+                entry.users -= 1
+            self._close_evicted()
+
+    def _acquire(self, name):
+        """Count a call against the shard, opening it if needed"""
+        while True:
+            with self._lock:
+                closing = self._closing.get(name)
+                entry = self._open.get(name)
+                opener = entry is None and closing is None
+                if opener:
+                    entry = _Shard()
+                    self._open[name] = entry
+                if entry is not None:
+                    self._open.move_to_end(name)
+                    entry.users += 1
+            if entry is not None:
+                break
+            # Not reopened until the old manager has flushed and closed, or
+            # the new one would load active sessions the old one still holds
+            closing.wait()
+
+        if opener:
+            try:
+                entry.manager = self._open_shard(name)
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    self._open.pop(name, None)
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+
+        if entry.error is not None:
+            with self._lock:
+                entry.users -= 1
+            raise entry.error
+
+        self._close_evicted()
+        return entry
+
+    def _close_evicted(self):
+        with self._lock:
+            evicted = self._evict()
+        for name, manager in evicted:
+            try:
+                manager.close()
+            finally:
+                with self._lock:
+                    self._closing.pop(name).set()
+
+    def _evict(self):
+        """Drop idle shards past max_open, oldest first; the caller holds the lock"""
+        evicted = []
+        if len(self._open) <= self.max_open:
+            return evicted
+        for name in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            entry = self._open[name]
+            if entry.users == 0 and entry.manager is not None:
+                del self._open[name]
+                self._closing[name] = threading.Event()
+                evicted.append((name, entry.manager))
+        return evicted
+
+    def _shard(self, guild_id):
+        return self._checkout(self.shard_name(guild_id))
+
+    def _existing_shards(self):
+        paths = glob.glob(os.path.join(self.shard_dir, "*.db"))
+        return sorted(os.path.basename(path)[:-3] for path in paths)
+
+    def initialize(self):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.logger.info(
+            f"Sharding storage by {self.mode} in {self.shard_dir}, "
+            f"up to {self.max_open} shards open"
+        )
+
+    def close(self):
+        with self._lock:
+            managers = [e.manager for e in self._open.values() if e.manager]
+            self._open.clear()
+        for manager in managers:
+            manager.close()
+
+    def save_guild_config(self, guild_id, config_data):
+        with self._shard(guild_id) as db:
+            return db.save_guild_config(guild_id, config_data)
+
+    def get_server_settings(self, guild_id):
+        with self._shard(guild_id) as db:
+            return db.get_server_settings(guild_id)
+
+    def get_server_setting(self, guild_id, setting_name):
+        with self._shard(guild_id) as db:
+            return db.get_server_setting(guild_id, setting_name)
+
+    def update_server_settings(self, guild_id, settings):
+        with self._shard(guild_id) as db:
+            return db.update_server_settings(guild_id, settings)
+
+    def get_today_away_time(self, user_id, guild_id):
+        with self._shard(guild_id) as db:
+            return db.get_today_away_time(user_id, guild_id)
+
+    def update_daily_totals(self, user_id, user_name, guild_id, *args):
+        with self._shard(guild_id) as db:
+            return db.update_daily_totals(user_id, user_name, guild_id, *args)
+
+    def record_away_session(self, user_id, user_name, guild_id, *args):
+        with self._shard(guild_id) as db:
+            return db.record_away_session(user_id, user_name, guild_id, *args)
+
+    def close_away_session(self, user_id, user_name, guild_id, *args):
+        with self._shard(guild_id) as db:
+            return db.close_away_session(user_id, user_name, guild_id, *args)
+
+    def _fetch_away_data(self, date, guild_id, user_id=None):
+        with self._shard(guild_id) as db:
+            return db._fetch_away_data(date, guild_id, user_id)
+
+    @contextmanager
+    def stream_away_data(self, date, guild_id, user_id=None):
+        with self._shard(guild_id) as db:
+            with db.stream_away_data(date, guild_id, user_id) as stream:
+                yield stream
+
+    def get_sessions_between(self, guild_id, start_ts, end_ts, user_id=None):
+        with self._shard(guild_id) as db:
+            return db.get_sessions_between(guild_id, start_ts, end_ts, user_id)
+
+    def get_period_totals(self, guild_id, period_type, period, user_id=None):
+        with self._shard(guild_id) as db:
+            return db.get_period_totals(guild_id, period_type, period, user_id)
+
+    def rebuild_period_totals(self, guild_id=None):
+        if guild_id:
+            with self._shard(guild_id) as db:
+                return db.rebuild_period_totals(guild_id)
+
+        written = 0
+        for name in self._existing_shards():
+            with self._checkout(name) as db:
+                written += db.rebuild_period_totals()
+        return written
+
+    def add_active_away_session(self, user_id, user_name, guild_id, expected_minutes):
+        with self._shard(guild_id) as db:
+            return db.add_active_away_session(
+                user_id, user_name, guild_id, expected_minutes
+            )
+
+    def remove_active_away_session(self, user_id, guild_id):
+        with self._shard(guild_id) as db:
+            return db.remove_active_away_session(user_id, guild_id)
+
+    def get_active_away_session(self, user_id, guild_id):
+        with self._shard(guild_id) as db:
+            return db.get_active_away_session(user_id, guild_id)
+
+    def archive_old_data(self):
+        """Archive every shard on disk; returns {month: rows moved} across shards"""
+        moved = {}
+        for name in self._existing_shards():
+            with self._checkout(name) as db:
+                for month, rows in db.archive_old_data().items():
+                    moved[month] = moved.get(month, 0) + rows
+        return moved
+
+    def prune_old_sessions(self):
+        """Roll up and prune every shard on disk; returns the total removed"""
+        pruned = 0
+        for name in self._existing_shards():
+            with self._checkout(name) as db:
+                pruned += db.prune_old_sessions()
+        return pruned
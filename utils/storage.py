@@ -0,0 +1,234 @@
+from contextlib import contextmanager
+from datetime import datetime
+from config import Config
+
+# Columns of server_settings that may be written from commands
+SETTINGS_COLUMNS = (
+    "command_prefix",
+    "channel_id",
+    "grace_period_minutes",
+    "fee_percentage_per_minute",
+    "max_single_away_minutes",
+    "max_daily_away_minutes",
+    "work_start_hour",
+    "work_end_hour",
+    "return_phrases",
+    "tracked_channels",
+)
+
+
+def clock_time(timestamp):
+    """Local wall-clock "HH:MM:SS" for an epoch timestamp, used for display"""
+    return datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+
+
+def iter_rows(cursor, chunk_size):
+    """Yield a cursor's rows, fetching ``chunk_size`` at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+class StorageBackend:
+    """Interface the cogs use to persist settings and away time.
+
+    DatabaseManager is the SQLite implementation and MemoryStorage keeps
+    everything in dictionaries. Both have to behave the same through these
+    methods: same return shapes, same ordering, same defaults. Dates are
+    "YYYY-MM-DD" strings and session times are epoch seconds.
+    """
+
+    # How many calls AsyncDatabaseManager may run at once, and how many of
+    # the report reads, which get executor threads of their own
+    max_workers = 1
+    report_workers = 1
+
+    def initialize(self):
+        """Create whatever the backend needs before the bot starts"""
+        raise NotImplementedError
+
+    def close(self):
+        """Flush pending work and release resources"""
+        raise NotImplementedError
+
+    # Server settings
+
+    def save_guild_config(self, guild_id, config_data):
+        """Replace a guild's settings, missing keys fall back to defaults"""
+        raise NotImplementedError
+
+    def get_server_settings(self, guild_id):
+        """Parsed ServerSettings for a guild, or defaults if not configured"""
+        raise NotImplementedError
+
+    def get_server_setting(self, guild_id, setting_name):
+        """One raw setting value, or the Config default if not configured"""
+        raise NotImplementedError
+
+    def update_server_settings(self, guild_id, settings):
+        """Update several settings at once; returns True if they were saved"""
+        raise NotImplementedError
+
+    def update_server_setting(self, guild_id, setting, value):
+        """Update a specific setting for a server"""
+        return self.update_server_settings(guild_id, {setting: value})
+
+    def is_work_hours(self, settings):
+        """Check if current time is within work hours (e.g., 08:00 - 16:00 on weekdays)."""
+        now = datetime.now()
+        current_time = now.time()
+
+        # Check if it's a weekday (0 = Monday, 4 = Friday)
+        is_weekday = now.weekday() < 5
+
+        # Work hours are parsed once, when the settings are loaded
+        work_start_hour = settings.work_start
+        work_end_hour = settings.work_end
+        if work_start_hour is None or work_end_hour is None:
+            self.logger.error(
+                f"Error parsing work hours: {settings.work_start_hour} - {settings.work_end_hour}"
+            )
+            return False
+
+        # Check if current time is between work hours
+        is_work_time = work_start_hour <= current_time <= work_end_hour
+
+        return is_weekday and is_work_time
+
+    # Away time
+
+    def get_today_away_time(self, user_id, guild_id):
+        """Total minutes the user has been away today"""
+        raise NotImplementedError
+
+    def update_daily_totals(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        minutes_away,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        """Add minutes to today's totals; returns (over_limit_minutes, fee_amount)"""
+        raise NotImplementedError
+
+    def record_away_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+    ):
+        """Record a complete away session for today"""
+        raise NotImplementedError
+
+    def close_away_session(
+        self,
+        user_id,
+        user_name,
+        guild_id,
+        start_ts,
+        end_ts,
+        expected_minutes,
+        actual_minutes,
+        fee_amount,
+        max_daily_minutes,
+        fee_percentage,
+    ):
+        """Record the session, add it to today's totals and end the active session.
+
+        Returns (over_limit_minutes, fee_amount) for the user's day and
+        raises if nothing could be written.
+        """
+        raise NotImplementedError
+
+    def _fetch_away_data(self, date, guild_id, user_id=None):
+        """Report data for one day.
+
+        With a user_id: ((user_name, total_minutes, over_limit_minutes, fee),
+        [(start_time, end_time, expected, actual, fee), ...]), or (None, [])
+        if the user has no record that day. Without: a list of daily records
+        ordered by total_minutes descending and the day's sessions with the
+        user_name first. Sessions are ordered by start and the fee in the
+        daily records is the sum of the session fees.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def stream_away_data(self, date, guild_id, user_id=None):
+        """_fetch_away_data for reports too big to hold in memory.
+
+        Yields (summary, session_count, sessions): summary is the user's
+        record (or None) or an iterable of daily records, sessions an
+        iterable of session rows. Both have to be consumed inside the
+        ``with`` block. Backends without a cursor just wrap the lists.
+        """
+        summary, sessions = self._fetch_away_data(date, guild_id, user_id)
+        yield summary, len(sessions), iter(sessions)
+
+    def get_sessions_between(self, guild_id, start_ts, end_ts, user_id=None):
+        """(user_id, user_name, start_ts, end_ts, expected_minutes,
+        actual_minutes, fee_amount) tuples started in [start_ts, end_ts)"""
+        raise NotImplementedError
+
+    def get_period_totals(self, guild_id, period_type, period, user_id=None):
+        """(user_id, user_name, session_count, total_minutes, over_limit_minutes,
+        late_count, fee_amount) for a "week" ("YYYY-Www") or "month"
+        ("YYYY-MM"), ordered by total_minutes descending"""
+        raise NotImplementedError
+
+    def rebuild_period_totals(self, guild_id=None):
+        """Recompute the weekly and monthly totals; returns rows written"""
+        return 0
+
+    # Active sessions
+
+    def add_active_away_session(self, user_id, user_name, guild_id, expected_minutes):
+        """Start (or restart) a user's away session now"""
+        raise NotImplementedError
+
+    def remove_active_away_session(self, user_id, guild_id):
+        """Drop a user's away session without recording it"""
+        raise NotImplementedError
+
+    def get_active_away_session(self, user_id, guild_id):
+        """Session dict with user_id, user_name, guild_id, start_time,
+        start_ts and expected_minutes, or None"""
+        raise NotImplementedError
+
+    # Housekeeping
+
+    def archive_old_data(self):
+        """Move old history out of the hot store; returns {month: rows}"""
+        return {}
+
+    def prune_old_sessions(self):
+        """Roll up and drop expired sessions; returns the number removed"""
+        return 0
+
+
+def create_storage(backend=None):
+    """Build the storage backend named by ``backend`` or STORAGE_BACKEND"""
+    backend = (backend or Config.STORAGE_BACKEND).lower()
+
+    if backend == "sqlite":
+        if Config.DB_SHARD_MODE != "none":
+            from utils.sharding import ShardedStorage
+
+            return ShardedStorage(Config.DB_SHARD_MODE)
+
+        from utils.db_manager import DatabaseManager
+
+        return DatabaseManager()
+    if backend == "memory":
+        from utils.memory_storage import MemoryStorage
+
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,184 @@
+"""Bulk export and import of the loyalty tables as NDJSON or CSV.
+
+    python -m utils.transfer export away_time --format ndjson -o away_time.ndjson
+    python -m utils.transfer import away_time away_time.ndjson --db other.db
+
+Rows are streamed with fetchmany() on export and written with
+executemany() in one transaction per chunk on import, so memory use stays
+flat however large the history is. ``-`` reads stdin or writes stdout.
+Imports go straight to the database file, so stop the bot first; it keeps
+active sessions and today's totals in memory.
+"""
+
+import csv
+import sys
+import json
+import logging
+import argparse
+from config import Config
+from utils.db_manager import DatabaseManager
+
+# Table -> how imported rows are written. History rows get new ids; tables
+# with a natural key replace the existing row for that key.
+TABLES = {
+    "server_settings": "INSERT OR REPLACE",
+    "away_time": "INSERT",
+    "away_daily": "INSERT OR REPLACE",
+    "active_away_sessions": "INSERT OR REPLACE",
+    "away_time_rollup": "INSERT OR REPLACE",
+}
+
+CHUNK_SIZE = 5000
+
+
+def table_columns(conn, table):
+    """Column names of ``table``, without the surrogate ``id``"""
+    rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return [row[1] for row in rows if row[1] != "id"]
+
+
+def export_rows(conn, table, chunk_size=CHUNK_SIZE):
+    """Yield dicts for every row of ``table``, fetched ``chunk_size`` at a time"""
+    columns = table_columns(conn, table)
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def import_rows(conn, table, rows, chunk_size=CHUNK_SIZE):
+    """Insert an iterable of row dicts into ``table``; returns the row count.
+
+    Every chunk is committed on its own, so an import that fails part way
+    keeps the chunks before the bad row.
+    """
+    known = table_columns(conn, table)
+    columns = None
+    sql = None
+    imported = 0
+    chunk = []
+
+    def flush():
+        conn.executemany(sql, chunk)
+        conn.commit()
+        chunk.clear()
+
+    for row in rows:
+        if columns is None:
+            columns = [column for column in row if column != "id"]
+            unknown = set(columns) - set(known)
+            if unknown:
+                raise ValueError(
+                    f"Unknown columns for {table}: {', '.join(sorted(unknown))}"
+                )
+            sql = (
+                f"{TABLES[table]} INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})"
+            )
+
+        chunk.append(tuple(row.get(column) for column in columns))
+        if len(chunk) >= chunk_size:
+            imported += len(chunk)
+            flush()
+
+    if chunk:
+        imported += len(chunk)
+        flush()
+    return imported
+
+
+def write_ndjson(rows, out):
+    for row in rows:
+        out.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+def read_ndjson(source):
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_csv(rows, out):
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def read_csv(source):
+    # CSV has no NULL, empty fields come back as None; SQLite's column
+    # affinity turns the numeric strings back into numbers
+    for row in csv.DictReader(source):
+        yield {key: (value if value != "" else None) for key, value in row.items()}
+
+
+FORMATS = {
+    "ndjson": (write_ndjson, read_ndjson),
+    "csv": (write_csv, read_csv),
+}
+
+
+def _open(path, mode):
+    if path == "-":
+        return sys.stdout if "w" in mode else sys.stdin
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.transfer", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--db", default=Config.DB_PATH, help="database file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write a table out")
+    export.add_argument("table", choices=TABLES)
+    export.add_argument("-o", "--output", default="-")
+    export.add_argument("--format", choices=FORMATS, default="ndjson")
+
+    load = commands.add_parser("import", help="load rows into a table")
+    load.add_argument("table", choices=TABLES)
+    load.add_argument("input", nargs="?", default="-")
+    load.add_argument("--format", choices=FORMATS, default="ndjson")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger = logging.getLogger("discord_bot")
+
+    # Creates and migrates the schema, so a fresh file can be imported into
+    db = DatabaseManager(args.db, pool_size=1)
+    db.initialize()
+    writer, reader = FORMATS[args.format]
+
+    try:
+        with db.get_connection() as conn:
+            if args.command == "export":
+                out = _open(args.output, "w")
+                try:
+                    writer(export_rows(conn, args.table, args.chunk_size), out)
+                finally:
+                    if out is not sys.stdout:
+                        out.close()
+                logger.info(f"Exported {args.table} from {args.db}")
+            else:
+                source = _open(args.input, "r")
+                try:
+                    count = import_rows(
+                        conn, args.table, reader(source), args.chunk_size
+                    )
+                finally:
+                    if source is not sys.stdin:
+                        source.close()
+                logger.info(f"Imported {count} rows into {args.table} in {args.db}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
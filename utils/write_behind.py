@@ -0,0 +1,114 @@
+import sqlite3
+import logging
+import threading
+
+
+def _is_busy(error):
+    """Whether a sqlite3 error means the database was locked, not bad data"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteBehindQueue:
+    """Buffers write statements and commits them in batches (group commit).
+
+    Each enqueued item is a group of ``(sql, params)`` statements that must
+    apply together. A background thread flushes every ``flush_interval_ms``
+    or as soon as ``max_batch`` groups are waiting, writing the whole batch
+    in one transaction. Every group runs inside its own SAVEPOINT, so one bad
+    group is rolled back and logged without losing the rest of the batch.
+    A locked database or an exhausted pool fails the whole batch instead,
+    which goes back to the front of the queue for the next flush.
+    """
+
+    def __init__(self, pool, flush_interval_ms=50, max_batch=200):
+        self.pool = pool
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.logger = logging.getLogger("discord_bot")
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="db-write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def enqueue(self, statements):
+        """Queue a group of statements to be committed together"""
+        with self._lock:
+            self._pending.append(list(statements))
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Commit everything queued so far; returns the number of groups written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            try:
+                with self.pool.connection() as conn:
+                    # Take the write lock up front, so a busy database fails
+                    # the whole batch here instead of a group's first statement
+                    conn.execute("BEGIN IMMEDIATE")
+                    for group in batch:
+                        self._apply_group(conn, group)
+                    conn.commit()
+            except Exception as e:
+                # Locked or busy database, or no connection free in the pool;
+                # nothing was committed, so retry the whole batch next round
+                self.logger.error(
+                    f"Write-behind flush of {len(batch)} groups failed, "
+                    f"will retry: {type(e).__name__}: {e}"
+                )
+                with self._lock:
+                    self._pending[:0] = batch
+                return 0
+
+            return len(batch)
+
+    def _apply_group(self, conn, group):
+        conn.execute("SAVEPOINT write_group")
+        try:
+            for sql, params in group:
+                conn.execute(sql, params)
+            conn.execute("RELEASE write_group")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO write_group")
+            conn.execute("RELEASE write_group")
+            if _is_busy(e):
+                raise  # Not the group's fault, fail the batch so it is retried
+            self.logger.error(f"Dropped write-behind group after error: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep flushing; a dead thread would silently stop all writes
+                self.logger.error(f"Write-behind flush thread error: {e}")
+
+    def close(self):
+        """Stop the flush thread and write whatever is still queued"""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        if self._pending:
+            self.logger.error(
+                f"Write-behind closed with {len(self._pending)} groups unwritten"
+            )